@@ -0,0 +1,30 @@
+# approximate answers for aggregate questions, estimated from a uniform sample table kept next to a large table
+
+SAMPLE_SUFFIX = "__sample"  # sample tables are hidden from the table listings
+APPROXIMATE_PREFIX = "approx:"  # questions starting with this are answered from the sample
+Z_95 = 1.96  # normal quantile of a 95% confidence interval
+
+
+# name of the sample table kept for a table
+def sample_table_name(table_name):
+    return f"{table_name}{SAMPLE_SUFFIX}"
+
+
+def is_sample_table(table_name):
+    return table_name.lower().endswith(SAMPLE_SUFFIX)
+
+
+# select expressions estimating an aggregate over the full table from a bernoulli sample with the given
+# inclusion probability, followed by the half-width of its 95% confidence interval; None when a sample
+# has no unbiased estimate of the aggregation (MIN, MAX)
+def estimator_columns(aggregation, column, fraction):
+    if aggregation == "SUM":  # horvitz-thompson total, variance estimated from the sampled squares
+        return [f"SUM({column}) / {fraction} AS \"SUM({column})\"",
+                f"{Z_95} * SQRT(SUM({column} * 1.0 * {column}) * {1 - fraction}) / {fraction} AS margin_95"]
+    if aggregation == "COUNT":  # the sampled count is binomial
+        return [f"COUNT({column}) / {fraction} AS \"COUNT({column})\"",
+                f"{Z_95} * SQRT(COUNT({column}) * {1 - fraction}) / {fraction} AS margin_95"]
+    if aggregation == "AVG":  # the sample mean is unbiased, its standard error shrinks with the sample size
+        return [f"AVG({column}) AS \"AVG({column})\"",
+                f"{Z_95} * STDDEV_SAMP({column}) / SQRT(COUNT({column})) * SQRT({1 - fraction}) AS margin_95"]
+    return None
@@ -0,0 +1,45 @@
+# on-disk store for per-table artifacts built at upload time, such as lexical indexes
+
+import gzip
+import json
+import os
+from db_config import cache_config
+
+
+class ArtifactStore:
+
+    def __init__(self, database, base_dir=None):
+        # artifacts are kept per database so two schemas never share an index
+        self.base_dir = os.path.join(base_dir or cache_config["artifact_dir"], database)
+
+    # file that holds one kind of artifact for a table
+    def path(self, kind, table_name):
+        return os.path.join(self.base_dir, kind, f"{table_name.lower()}.json.gz")
+
+    # write an artifact atomically as compressed json
+    def save(self, kind, table_name, data):
+        path = self.path(kind, table_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(temp_path, path)  # readers never see a half-written file
+
+    # read an artifact, None if it was never built
+    def load(self, kind, table_name):
+        try:
+            with gzip.open(self.path(kind, table_name), "rt", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    # remove every artifact of a table
+    def delete_table(self, table_name):
+        if not os.path.isdir(self.base_dir):
+            return
+        for kind in os.listdir(self.base_dir):
+            try:
+                os.remove(self.path(kind, table_name))
+            except FileNotFoundError:
+                continue
+
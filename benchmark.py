@@ -0,0 +1,370 @@
+# reproducible benchmarks of the hot paths: type inference, csv row counting, schema profiling, uploads, question
+# parsing, sample query generation and result display, with throughput, peak memory and a stored baseline to
+# compare with
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+import numpy as np
+from db_config import upload_config, backend_config, cache_config
+from db_conn import DatabaseConnection
+from db_backends import SQLiteBackend
+from type_inference import infer_column_types
+from uploads_analysis import UploadsAnalysis
+from csv_scanner import CSVScanner
+from schema_catalog import SchemaCatalog
+from nlp import NLPProcessor
+from sample_query_generator import QueryGenerator, CONSTRUCT_TEMPLATES
+from table_renderer import TableRenderer
+from chatdb import display_results
+
+COLUMN_KINDS = ("int", "decimal", "date", "datetime", "boolean", "category", "text")
+DEFAULT_TYPE_MIX = "int=2,decimal=2,date=1,datetime=1,boolean=1,category=2,text=1"
+CATEGORY_WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliett",
+                  "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango"]
+TEXT_WORDS = CATEGORY_WORDS + ["the", "quick", "brown", "fox", "jumps", "over", "lazy", "dog"]
+QUESTION_TEMPLATES = [  # corpus of questions, filled with columns and values of the generated table
+    "total {quantitative} by {categorical}",
+    "average {quantitative} by {categorical}",
+    "maximum {quantitative} where {categorical} equals {value}",
+    "show {categorical} and {quantitative} where {quantitative} greater than {number}",
+    "count {categorical} where {quantitative} less than {number}",
+    "show top 5 {categorical} with highest {quantitative}",
+    "what is the minimum {quantitative} for {value}",
+    "list {categorical} where {categorical} is {value} and {quantitative} greater than {number}"
+]
+GENERATE_BLOCK_ROWS = 10000  # rows generated and written together
+REGRESSION_TOLERANCE = 0.1  # throughput this far below the baseline counts as a regression
+
+
+# parse "int=2,text=1" into column kind weights
+def parse_type_mix(type_mix):
+    weights = {}
+    for part in type_mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in COLUMN_KINDS:
+            raise ValueError(f"Unknown column kind '{kind}', expected one of {', '.join(COLUMN_KINDS)}")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+# column kinds of a synthetic table, drawn from the type mix
+def column_kinds(column_count, type_mix, rng):
+    weights = parse_type_mix(type_mix)
+    kinds = list(weights)
+    probabilities = np.array([weights[kind] for kind in kinds]) / sum(weights.values())
+    return [kinds[idx] for idx in rng.choice(len(kinds), size=column_count, p=probabilities)]
+
+
+# string values of one column kind for a block of rows, with empty values at the null rate
+def column_values(kind, row_count, rng, null_rate):
+    if kind == "int":
+        values = rng.integers(0, 100000, size=row_count).astype(str)
+    elif kind == "decimal":
+        values = np.char.mod("%.2f", rng.uniform(0, 10000, size=row_count))
+    elif kind == "date":
+        start = date(2000, 1, 1)
+        values = np.array([(start + timedelta(days=int(day))).isoformat()
+                           for day in rng.integers(0, 9000, size=row_count)])
+    elif kind == "datetime":
+        start = datetime(2000, 1, 1)
+        values = np.array([(start + timedelta(seconds=int(second))).strftime("%Y-%m-%d %H:%M:%S")
+                           for second in rng.integers(0, 700000000, size=row_count)])
+    elif kind == "boolean":
+        values = np.where(rng.random(row_count) < 0.5, "true", "false")
+    elif kind == "category":
+        values = np.array(CATEGORY_WORDS)[rng.integers(0, len(CATEGORY_WORDS), size=row_count)]
+    else:
+        words = np.array(TEXT_WORDS)
+        values = np.array([" ".join(words[rng.integers(0, len(words), size=length)])
+                           for length in rng.integers(3, 9, size=row_count)])
+    values = values.astype(object)
+    values[rng.random(row_count) < null_rate] = ""
+    return values
+
+
+# write a synthetic csv with the given shape and type mix, returns (header, column kinds)
+def generate_csv(path, row_count, column_count, type_mix=DEFAULT_TYPE_MIX, null_rate=0.02, seed=0):
+    rng = np.random.default_rng(seed)
+    kinds = column_kinds(column_count, type_mix, rng)
+    header = [f"{kind}_{idx}" for idx, kind in enumerate(kinds)]
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for start in range(0, row_count, GENERATE_BLOCK_ROWS):
+            block_rows = min(GENERATE_BLOCK_ROWS, row_count - start)
+            columns = [column_values(kind, block_rows, rng, null_rate) for kind in kinds]
+            writer.writerows(zip(*columns))
+    return header, kinds
+
+
+class StandInCursor:
+    rowcount = 0
+    description = None
+
+    def execute(self, query, params=None):
+        pass
+
+    def executemany(self, query, rows):
+        self.rowcount = len(rows)
+
+    def fetchone(self):
+        return (0,)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+
+    def cursor(self, **cursor_options):
+        return StandInCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# embedded stand-in for DatabaseConnection that accepts every statement, so uploads measure the client side only
+class StandInDatabase:
+    database = "chatdb_benchmark"
+
+    def __init__(self):
+        self.connection = StandInConnection()
+        self.backend = SQLiteBackend()  # only its dialect is used, the statements are never run
+
+    def get_cursor(self):
+        return self.connection.cursor()
+
+    def acquire(self, timeout=None):
+        return StandInConnection()
+
+    def release(self, conn):
+        pass
+
+    def discard(self, conn):
+        pass
+
+    @contextlib.contextmanager
+    def cursor(self, commit=False, **cursor_options):
+        yield StandInCursor()
+
+    def disconnect(self):
+        pass
+
+
+# schema catalog preloaded with a table's columns, so metadata never comes from the server
+def seeded_catalog(db_connection, table_name, header, column_types):
+    catalog = SchemaCatalog(db_connection)
+    data_types = ["tinyint" if column_type == "BOOLEAN" else column_type.split("(")[0].lower()
+                  for column_type in column_types]
+    catalog.columns = {table_name.lower(): list(zip(header, data_types))}
+    return catalog
+
+
+# seeded corpus of questions over the columns of a table
+def question_corpus(header, kinds, count, seed=0):
+    rng = random.Random(seed)
+    quantitative = [name for name, kind in zip(header, kinds) if kind in ("int", "decimal")] or header
+    categorical = [name for name, kind in zip(header, kinds) if kind in ("category", "text", "date")] or header
+    return [rng.choice(QUESTION_TEMPLATES).format(quantitative=rng.choice(quantitative),
+                                                  categorical=rng.choice(categorical),
+                                                  value=rng.choice(CATEGORY_WORDS),
+                                                  number=rng.randint(1, 10000))
+            for _ in range(count)]
+
+
+# best time over the repeats and the units processed, then the peak traced memory of one more run
+def measure(function, repeat):
+    timings = []
+    units = 0
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        units = function()
+        timings.append(time.perf_counter() - start_time)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), units, peak
+
+
+# run the selected benchmarks, returns name -> {"unit", "units", "seconds", "throughput", "peak_mb"}
+def run_benchmarks(args):
+    rng = np.random.default_rng(args.seed)
+    work_dir = tempfile.mkdtemp(prefix="chatdb_benchmark_")
+    cache_config["artifact_dir"] = os.path.join(work_dir, "artifacts")  # removed with the csv, not left in the cwd
+    db_connection = StandInDatabase()
+    if args.backend:
+        backend_config["backend"] = args.backend
+        backend_config["sqlite_path"] = os.path.join(work_dir, "chatdb.sqlite3")  # the embedded engines' files too
+        backend_config["duckdb_path"] = os.path.join(work_dir, "chatdb.duckdb")
+        db_connection = DatabaseConnection()
+        db_connection.connect()
+
+    csv_path = os.path.join(work_dir, "benchmark.csv")
+    table_name = "benchmark_table"
+    header, kinds = generate_csv(csv_path, args.rows, args.columns, args.type_mix, seed=args.seed)
+    uploads_analysis = UploadsAnalysis(db_connection, SchemaCatalog(db_connection))
+
+    with open(csv_path, newline="") as file:
+        rows = list(csv.reader(file))[1:]
+    column_types = infer_column_types(header, rows)
+    catalog = seeded_catalog(db_connection, table_name, header, column_types)
+    wide_header = [f"{kind}_{idx}" for idx, kind in enumerate(column_kinds(args.wide_columns, args.type_mix, rng))]
+    wide_types = ["DECIMAL(20, 6)" if name.startswith(("int", "decimal")) else "VARCHAR(20)" for name in wide_header]
+    wide_catalog = seeded_catalog(db_connection, "wide_table", wide_header, wide_types)
+    questions = question_corpus(header, kinds, args.questions, args.seed)
+    display_rows = [tuple(row) for row in rows[:args.display_rows]]
+    while len(display_rows) < args.display_rows:  # repeat the file rows to reach the requested result size
+        display_rows += display_rows[:args.display_rows - len(display_rows)]
+
+    # each benchmark returns the number of units it processed
+    def infer():
+        infer_column_types(header, rows)
+        for column_idx in range(min(len(header), 5)):  # the single-column wrapper the upload menu used
+            uploads_analysis.infer_column_type([row[column_idx] for row in rows[:upload_config["reservoir_size"]]])
+        return len(rows) * len(header)
+
+    def drop_table():
+        if args.backend:
+            with db_connection.cursor(commit=True) as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {db_connection.backend.quote(table_name)};")
+
+    def count_rows():
+        with CSVScanner(csv_path) as scanner:
+            return scanner.count_rows()
+
+    def create_table():
+        drop_table()
+        uploads_analysis.create_table_from_csv(table_name, csv_path)
+        return len(rows)
+
+    def upload():
+        drop_table()
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            if uploads_analysis.upload_dataset(table_name, csv_path) == "back_to_home":
+                raise RuntimeError("upload failed")
+        return len(rows)
+
+    nlp_processor = NLPProcessor(db_connection, catalog)
+
+    def extract_intent():
+        nlp_processor.forget_table()  # include building the table's matchers, as the first question does
+        for question in questions:
+            nlp_processor.extract_intent(question, table_name)
+        return len(questions)
+
+    query_generator = QueryGenerator(db_connection, wide_catalog)
+
+    def generate_queries():
+        count = 0
+        for _ in range(args.generator_rounds):
+            count += len(query_generator.generate_systematic_queries("wide_table"))
+            for construct in CONSTRUCT_TEMPLATES:
+                count += len(query_generator.generate_queries_by_construct("wide_table", construct))
+        return count
+
+    def display():
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            display_results(display_rows, header)
+        return len(display_rows)
+
+    benchmarks = {  # name -> (function, unit)
+        "infer_column_types": (infer, "values"),
+        "count_csv_rows": (count_rows, "rows"),
+        "create_table_from_csv": (create_table, "rows"),
+        "upload_dataset": (upload, "rows"),
+        "extract_intent": (extract_intent, "questions"),
+        "query_generator": (generate_queries, "queries"),
+        "display_results": (display, "rows")
+    }
+    results = {}
+    try:
+        for name, (function, unit) in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            seconds, units, peak = measure(function, args.repeat)
+            results[name] = {"unit": unit, "units": units, "seconds": seconds,
+                             "throughput": units / seconds if seconds > 0 else 0.0, "peak_mb": peak / 2 ** 20}
+    finally:
+        drop_table()
+        db_connection.disconnect()
+        shutil.rmtree(work_dir)  # after the connection closed the database files in it
+    return results
+
+
+# compare throughput with a baseline, returns name -> throughput ratio
+def compare_with_baseline(results, baseline):
+    return {name: result["throughput"] / baseline[name]["throughput"]
+            for name, result in results.items() if baseline.get(name, {}).get("throughput")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ChatDB hot paths on synthetic data.")
+    parser.add_argument("--rows", type=int, default=100000, help="rows of the synthetic csv")
+    parser.add_argument("--columns", type=int, default=12, help="columns of the synthetic csv")
+    parser.add_argument("--type-mix", default=DEFAULT_TYPE_MIX, help="column kind weights, eg. int=2,text=1")
+    parser.add_argument("--wide-columns", type=int, default=400, help="columns of the query generator table")
+    parser.add_argument("--questions", type=int, default=2000, help="questions in the parsing corpus")
+    parser.add_argument("--generator-rounds", type=int, default=200, help="sample query rounds per run")
+    parser.add_argument("--display-rows", type=int, default=100000, help="rows of the displayed result")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the best one counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="benchmarks to run, all by default")
+    parser.add_argument("--backend", choices=["mysql", "sqlite", "duckdb"],
+                        help="upload into this storage backend as configured in db_config, "
+                             "instead of the in-process stand-in")
+    parser.add_argument("--baseline", help="json results to compare with")
+    parser.add_argument("--save-baseline", help="write the results as json to this path")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    ratios = compare_with_baseline(results, baseline)
+
+    rows = []
+    for name, result in results.items():
+        ratio = ratios.get(name)
+        rows.append((name, f"{result['units']:,} {result['unit']}", f"{result['seconds']:.3f}",
+                     f"{result['throughput']:,.0f}/s", f"{result['peak_mb']:.1f}",
+                     "" if ratio is None else f"{ratio:.2f}x"))
+    column_names = ["benchmark", "work", "best s", "throughput", "peak MB", "vs baseline"]
+    TableRenderer(column_names, sample_rows=rows).write_table(rows)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline written to {args.save_baseline}.")
+
+    regressions = [name for name, ratio in ratios.items() if ratio < 1 - REGRESSION_TOLERANCE]
+    if regressions:
+        print(f"Slower than the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,14 @@ from db_conn import DatabaseConnection
 from uploads_analysis import UploadsAnalysis
 from sample_query_generator import QueryGenerator
 from nlp import NLPProcessor
+from schema_catalog import SchemaCatalog
+from query_cache import QueryCache, estimate_result_size
+from db_config import display_config
+from table_renderer import TableRenderer
+from approximate import APPROXIMATE_PREFIX
+from index_advisor import IndexAdvisor
+from tracing import tracer
+from query_runner import QueryRunner, QueryCancelled
 
 
 # function to display query results in a table-like format
@@ -11,18 +19,7 @@ def display_results(results, column_names=None):
     if not results:
         print("No results found.")
         return
-
-    col_widths = [max(len(str(value)) for value in col) for col in
-                  zip(column_names, *results)]  # define column widths for formatting
-    total_width = sum(col_widths) + len(col_widths) * 3 + 1  # adjust for borders and spacing
-    print("+" + "-" * (total_width - 2) + "+")  # print the top border using total_width
-
-    if column_names:  # print the header row with borders if column_names are provided
-        print("| " + " | ".join(f"{col_name:<{col_widths[idx]}}" for idx, col_name in enumerate(column_names)) + " |")
-        print("+" + "-" * (total_width - 2) + "+")  # border after the header
-    for row in results:  # print each row with borders
-        print("| " + " | ".join(f"{str(value):<{col_widths[idx]}}" for idx, value in enumerate(row)) + " |")
-    print("+" + "-" * (total_width - 2) + "+")  # print the bottom border using total_width
+    TableRenderer(column_names, sample_rows=results).write_table(results)  # widths come from the first rows
 
 
 # explanation regarding sql constructs
@@ -45,9 +42,17 @@ class ChatDB:
 
     def __init__(self):
         self.db_connection = DatabaseConnection()  # database connection object
-        self.uploads_analysis = UploadsAnalysis(self.db_connection)  # handles user input
-        self.query_generator = QueryGenerator(self.db_connection)  # handles sample query-specific operations
-        self.nlp_processor = NLPProcessor(self.db_connection)  # natural language processing for user input
+        self.schema_catalog = SchemaCatalog(self.db_connection)  # column metadata shared by all components
+        self.table_registry = self.schema_catalog.table_registry  # cached table list for the menus
+        self.uploads_analysis = UploadsAnalysis(self.db_connection, self.schema_catalog)  # handles user input
+        # handles sample query-specific operations
+        self.query_generator = QueryGenerator(self.db_connection, self.schema_catalog)
+        # natural language processing for user input
+        self.nlp_processor = NLPProcessor(self.db_connection, self.schema_catalog)
+        self.query_cache = QueryCache()  # question -> sql and sql -> results
+        self.schema_catalog.add_listener(self.query_cache.invalidate)  # upload/remove drop dependent entries
+        self.index_advisor = IndexAdvisor(self.db_connection, self.schema_catalog)  # learns from queries run
+        self.query_runner = QueryRunner(self.db_connection)  # runs questions with a timeout, cancellable
 
     def start(self):
         self.db_connection.connect()
@@ -58,6 +63,7 @@ class ChatDB:
             print("3. Explore specific datasets")
             print("4. Obtain sample queries")
             print("5. Ask inquiries")
+            print("6. Index advisor")
             print("Type 'exit' to quit")
             print()
             user_input = input("Type your request here (eg. 1): ").strip()
@@ -68,7 +74,8 @@ class ChatDB:
             elif user_input == '1':
                 # initial prompt for the table name and file path
                 table_name = input("Enter the table name for the dataset: ").strip()
-                file_path = input("Enter the path to the CSV file: ").strip()
+                file_path = input("Enter the path to the CSV (optionally .gz/.zst), Parquet or Arrow file, or a "
+                                  "directory or glob of partitions: ").strip()
                 print("-" * 300)
                 # upload dataset with retry logic in place
                 result = self.uploads_analysis.upload_dataset(table_name, file_path)
@@ -84,28 +91,28 @@ class ChatDB:
                 self.display_sample_queries()  # sample queries
             elif user_input == '5':
                 self.query_database()  # query database
+            elif user_input == '6':
+                self.advise_indexes()  # index recommendations
             else:
                 print("Invalid input. Please try again.")  # invalid input
                 print("-" * 300)
         self.db_connection.disconnect()  # after breaking, disconnect from database
+        tracer.write_prometheus()  # session stage timings, when an export file is configured
+        tracer.close()
 
     # explore database tables
     def explore_database_tables(self):
         while True:  # outer loop to keep the user in the table selection page
             print("Available tables in the database:")
-            cursor = self.db_connection.get_cursor()
-            cursor.execute("SHOW TABLES;")
-            tables = cursor.fetchall()
-            cursor.close()
+            table_list = self.table_registry.tables()  # cached table list
 
-            if not tables:
+            if not table_list:
                 print("No tables found in the database.")
                 print("-" * 300)
                 return
 
-            table_list = [table[0] for table in tables]  # display table options
-            for idx, table in enumerate(tables, start=1):
-                print(f"- {table[0]}")
+            for table_name in table_list:  # display table options
+                print(f"- {table_name}")
             print("-" * 300)
 
             table_choice = input("Enter the name of the table you want to explore, or type 'back' to return to the "
@@ -120,7 +127,7 @@ class ChatDB:
                 print("-" * 300)
                 continue
 
-            if table_choice not in table_list:  # invalid table name
+            if table_choice not in self.table_registry:  # invalid table name
                 print(f"Invalid table name: '{table_choice}'. Please try again.")
                 print("-" * 300)
                 continue
@@ -140,17 +147,8 @@ class ChatDB:
             sample_data = self.uploads_analysis.get_sample_data(table_choice)  # fetch and display sample data
             print("\nSample Data:")
             if sample_data:
-                table_attributes = self.uploads_analysis.get_table_attributes(table_choice)  # get sample data
-                column_names = [col[0] for col in table_attributes]  # get column names
-                col_widths = [max(len(str(value)) for value in col) for col in zip(*sample_data, *[column_names])]
-                total_width = sum(col_widths) + len(col_widths) * 3 + 1
-                print("+" + "-" * (total_width - 2) + "+")
-                print("| " + " | ".join(
-                    f"{col_name:<{col_widths[idx]}}" for idx, col_name in enumerate(column_names)) + " |")
-                print("+" + "-" * (total_width - 2) + "+")
-                for row in sample_data:
-                    print("| " + " | ".join(f"{str(value):<{col_widths[idx]}}" for idx, value in enumerate(row)) + " |")
-                print("+" + "-" * (total_width - 2) + "+")  # print sample data
+                column_names = [col[0] for col in attributes]  # get column names
+                display_results(sample_data, column_names)  # print sample data
             print("-" * 300)
 
             while True:  # ask the user if they want to explore another table and loop until a valid response is given
@@ -169,17 +167,13 @@ class ChatDB:
     def display_sample_queries(self):
         while True:
             print("Available tables in the database:")
-            cursor = self.db_connection.get_cursor()
-            cursor.execute("SHOW TABLES;")
-            tables = cursor.fetchall()
-            cursor.close()
+            table_list = self.table_registry.tables()  # cached table list
 
-            if not tables:
+            if not table_list:
                 print("No tables found in the database.")
                 print("-" * 300)
                 return
 
-            table_list = [table[0] for table in tables]
             for table_name in table_list:
                 print(f"- {table_name}")
             print("-" * 300)
@@ -197,11 +191,14 @@ class ChatDB:
             table_choice = parts[0]
             construct = parts[1].upper() if len(parts) > 1 else None  # convert construct to uppercase if specified
 
-            if table_choice not in table_list:  # check if the table exists
+            if table_choice not in self.table_registry:  # check if the table exists
                 print(f"Table '{table_choice}' not found.")
                 print("-" * 300)
                 continue  # return to table selection
 
+            if self.query_generator.get_column_stats(table_choice) is None:  # uploaded before statistics existed
+                self.uploads_analysis.analyze_table(table_choice)  # later rounds pick literals from the data
+
             description_displayed = False  # flag to track if description has been shown
 
             while True:  # inner loop to display queries for the selected table
@@ -222,6 +219,7 @@ class ChatDB:
                     for query_info in construct_queries:
                         print(f"\nDescription: {query_info['description']}")
                         print(f"Query: {query_info['query']}")
+                        self.index_advisor.record(table_choice, query_info['query'])
 
                 else:
                     # generate random sample queries without a specified construct
@@ -234,6 +232,7 @@ class ChatDB:
                     for query_info in random_queries:
                         print(f"\nDescription: {query_info['description']}")
                         print(f"Query: {query_info['query']}")
+                        self.index_advisor.record(table_choice, query_info['query'])
                 print("-" * 300)
 
                 while True:  # ask the user if they want more sample queries for the same table
@@ -255,17 +254,13 @@ class ChatDB:
     def query_database(self):
         while True:
             print("Available tables in the database:")
-            cursor = self.db_connection.get_cursor()
-            cursor.execute("SHOW TABLES;")
-            tables = cursor.fetchall()
-            cursor.close()
+            table_list = [table.lower() for table in self.table_registry.tables()]  # cached table list
 
-            if not tables:
+            if not table_list:
                 print("No tables found in the database.")
                 print("-" * 300)
                 break
 
-            table_list = [table[0].lower() for table in tables]
             for table_name in table_list:
                 print(f"- {table_name}")
             print("-" * 300)
@@ -282,18 +277,78 @@ class ChatDB:
                 print("-" * 300)
                 continue
 
-            if table_name not in table_list:  # validate the table choice
+            if table_name not in self.table_registry:  # validate the table choice
                 print(f"Invalid table name: '{table_name}'. Please try again.")
                 print("-" * 300)
                 continue
 
             self.process_query(table_name)  # call on function to process the user's question for the selected table
 
+    # show finished index builds, then recommend indexes for a table and build the chosen ones in the background
+    def advise_indexes(self):
+        for report in self.index_advisor.take_reports():
+            if "error" in report:
+                print(f"Index {report['index_name']} on '{report['table']}' failed: {report['error']}")
+            else:
+                print(f"Index {report['index_name']} on '{report['table']}' was created.")
+                print(f"Query: {report['query']}")
+                print("\nPlan before:")
+                display_results(report["before"][1], report["before"][0])
+                print("\nPlan after:")
+                display_results(report["after"][1], report["after"][0])
+            print("-" * 300)
+
+        while True:
+            table_list = self.table_registry.tables()  # cached table list
+            if not table_list:
+                print("No tables found in the database.")
+                print("-" * 300)
+                return
+            print("Available tables in the database:")
+            for table_name in table_list:
+                print(f"- {table_name}")
+            print("-" * 300)
+
+            table_name = input("Enter the table name to get index recommendations for, or type 'back' to return "
+                               "to the main menu: ").strip().lower()
+            print("-" * 300)
+            if table_name == 'back':
+                return
+            if table_name not in self.table_registry:
+                print(f"Table '{table_name}' not found. Try again!")
+                print("-" * 300)
+                continue
+
+            recommendations = self.index_advisor.recommend(table_name)
+            if not recommendations:
+                print(f"No index recommendations for '{table_name}' yet. They come from the filter, grouping and "
+                      f"sort columns of the queries you run and the sample queries you view.")
+                print("-" * 300)
+                continue
+            for number, recommendation in enumerate(recommendations, 1):
+                uses = ", ".join(f"{kind} x{count}" for kind, count in recommendation["uses"].items() if count)
+                print(f"{number}. {recommendation['ddl']} ({uses})")
+            print("-" * 300)
+
+            choice = input("Enter the numbers of the indexes to create (eg. 1 3), 'all', or 'back': ").strip().lower()
+            print("-" * 300)
+            if choice == 'back':
+                continue
+            chosen = recommendations if choice == 'all' else [
+                recommendations[int(number) - 1] for number in choice.split()
+                if number.isdigit() and 0 < int(number) <= len(recommendations)]
+            for recommendation in chosen:
+                self.index_advisor.create_index(table_name, recommendation)
+                print(f"Building {recommendation['index_name']} in the background. Its EXPLAIN plans before and "
+                      f"after are shown here once it is done.")
+            print("-" * 300)
+
     # process user questions and execute appropriate queries based on the selected table
     def process_query(self, table_name):
         while True:
             print("Please type out all inquiries as accurately as possible. Check for all spelling errors!")
             print("Reference exact column/data names instead of using synonymous terms.")
+            print(f"Start a question with '{APPROXIMATE_PREFIX}' to estimate it from a sample of a large table.")
             user_input = input(f"Ask your question for table '{table_name}', or type 'back' to return to the "
                                f"main menu: ").strip()
 
@@ -301,8 +356,30 @@ class ChatDB:
                 print("-" * 300)
                 break
 
-            # extract intent and generate sql query
-            intent_data = self.nlp_processor.extract_intent(user_input, table_name)
+            if user_input.lower() == 'cache':  # show query cache hit/miss counters
+                for name, value in self.query_cache.stats().items():
+                    print(f"{name}: {value:,}")
+                print("-" * 300)
+                continue
+
+            if user_input.lower() == 'stats':  # show per-stage latency percentiles of the session
+                self.print_stage_stats()
+                print("-" * 300)
+                continue
+
+            tracer.start_trace()  # stages of this question share a trace id
+            approximate = user_input.lower().startswith(APPROXIMATE_PREFIX)  # answer from the sample table
+            if approximate:
+                user_input = user_input[len(APPROXIMATE_PREFIX):].strip()
+
+            # extract intent and generate sql query, reusing the sql of a question asked before
+            with tracer.span("intent") as span:
+                intent_data = self.query_cache.get_intent(table_name, user_input)
+                span.set(cache_hit=intent_data is not None)
+                if intent_data is None:
+                    intent_data = self.nlp_processor.extract_intent(user_input, table_name)
+                    if "error" not in intent_data:
+                        self.query_cache.put_intent(table_name, user_input, intent_data)
 
             if "error" in intent_data:  # handle errors returned by the nlpprocessor
                 print(f"Error: {intent_data['error']}")
@@ -311,24 +388,123 @@ class ChatDB:
 
             sql_query = intent_data.get("sql_query")  # extract the sql query and description
             description = intent_data.get("description")
-
-            cursor = None  # execute the query
+            approximate_note = None
+            if approximate:
+                approximate_query, approximate_note = self.nlp_processor.approximate_intent(intent_data, table_name)
+                if approximate_query:
+                    sql_query = approximate_query
+                else:
+                    print(approximate_note)  # why the question runs exactly
+                    approximate_note = None
+
+            conn = None  # execute the query
+            cursor = None
+            finished = False  # whether every result row was read, so the connection can be reused
+            fetch_span = tracer.begin("fetch")  # timed page by page, between the pages the user reads
+            render_span = tracer.begin("render")
             try:
                 if not sql_query:  # ensure that query is not None or empty
                     print("Error: No query generated.")
                     continue
-                cursor = self.db_connection.get_cursor()
-                cursor.execute(sql_query)
-                results = cursor.fetchall()
-                column_names = [desc[0] for desc in cursor.description]  # extract column names for display
+                with tracer.span("result_cache") as span:
+                    cached_result = self.query_cache.get_result(sql_query)
+                    span.set(cache_hit=cached_result is not None)
+                if cached_result:
+                    column_names, results = cached_result
+                    pages = (results[idx:idx + display_config["page_size"]]
+                             for idx in range(0, len(results), display_config["page_size"]))
+                else:
+                    conn = self.db_connection.acquire()  # pooled connection, free to abandon mid-result
+                    cursor = conn.cursor()  # unbuffered: rows stay on the server until fetched
+                    with tracer.span("execute"):
+                        self.query_runner.execute(conn, cursor, sql_query)  # ctrl-c or the timeout cancels it
+                    column_names = [desc[0] for desc in cursor.description]  # extract column names for display
+                    results = []  # rows kept for the result cache, no more than the row cap
+                    pages = self.fetch_pages(conn, cursor, results, fetch_span)
                 print("-" * 300)
                 print(f"You asked to {description}.")
                 print("\nThis is the corresponding SQL query: " + "\033[1m" + f"{sql_query};" + "\033[0m")
                 print("\nQuery results:")
-                display_results(results, column_names)
+                finished = self.page_results(pages, column_names, render_span)
+                if approximate_note:
+                    print(approximate_note)
+                self.index_advisor.record(table_name, intent_data["sql_query"])  # the exact query's columns
+                if finished and not cached_result:  # every row was shown, so at most row_cap rows are kept
+                    self.query_cache.put_result(sql_query, table_name, column_names, results)
+            except QueryCancelled as e:
+                conn = None  # the worker thread still running the statement discards the connection
+                print(e)
             except Exception as e:
                 print(f"Error executing query: {e}")
             finally:
-                if cursor:
-                    cursor.close()
+                fetch_span.finish()
+                render_span.finish()
+                if conn:
+                    if finished:
+                        cursor.close()
+                        self.db_connection.release(conn)
+                    else:
+                        self.db_connection.discard(conn)  # closing is cheaper than draining unread rows
             print("-" * 300)
+
+    # per-stage count, latency percentiles, rows, bytes and cache hit rate of the questions asked this session
+    @staticmethod
+    def print_stage_stats():
+        summary = tracer.summary()
+        if not summary:
+            print("No questions timed yet.")
+            return
+        rows = [(stage, stats["count"], f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", f"{stats['p99']:.2f}",
+                 f"{stats['rows']:,}", f"{stats['bytes']:,}",
+                 "" if stats["cache_hit_rate"] is None else f"{stats['cache_hit_rate']:.0%}")
+                for stage, stats in summary.items()]
+        column_names = ["stage", "count", "p50 ms", "p95 ms", "p99 ms", "rows", "bytes", "cache hits"]
+        display_results(rows, column_names)
+        path = tracer.write_prometheus()
+        if path:
+            print(f"Stage timings written to {path}.")
+
+    # yield result rows from an unbuffered cursor one page at a time, copying them into kept_rows for the result
+    # cache; paging stops at the row cap, which bounds kept_rows
+    def fetch_pages(self, conn, cursor, kept_rows, span):
+        while True:
+            with span.timed():
+                page = self.query_runner.fetch(conn, cursor, display_config["page_size"])
+            if not page:
+                return
+            span.add(rows=len(page), bytes=estimate_result_size((), page))
+            kept_rows.extend(page)
+            yield page
+
+    # print result pages as they arrive, asking before each further page; returns True once every row was shown
+    @staticmethod
+    def page_results(pages, column_names, span):
+        page = next(pages, None)
+        if not page:
+            with span.timed():  # rendering of the question's result is timed here, not in display_results
+                display_results([], column_names)
+            return True
+        with span.timed():
+            renderer = TableRenderer(column_names, sample_rows=page)  # widths fixed by the first page
+            renderer.write_header()
+        shown_count = 0
+        while True:
+            with span.timed():  # rendering only, not the time the user takes to answer
+                renderer.write_rows(page)
+                renderer.write_footer()
+            span.add(rows=len(page))
+            shown_count += len(page)
+            next_page = next(pages, None)  # look one page ahead so the prompt only appears when more rows exist
+            if not next_page:
+                return True
+            if shown_count >= display_config["row_cap"]:
+                print(f"Showing the first {shown_count:,} rows. Add a filter or LIMIT to see the rest.")
+                return False
+            while True:
+                more_rows = input(f"Shown {shown_count:,} rows. Show the next page? (yes/no): ").strip().lower()
+                if more_rows in ("yes", "no"):
+                    break
+                print("Invalid input. Please enter 'yes' or 'no'.")
+            if more_rows == "no":
+                return False
+            page = next_page
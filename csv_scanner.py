@@ -0,0 +1,159 @@
+# memory-mapped csv scanning: row boundaries found with vectorized byte searches instead of a python-level parse,
+# so rows can be counted and blocks of rows sliced straight out of the mapped file
+
+import csv
+import io
+import locale
+import mmap
+import os
+from itertools import chain, islice
+import numpy as np
+
+NEWLINE = ord("\n")
+QUOTE = ord('"')
+SENTINEL = "\x00"  # row parsed after a block, it stays a row of its own only if the block ends on a row boundary
+
+
+class CSVScanner:
+
+    def __init__(self, csv_file_path, chunk_bytes=64 * 1024 * 1024):
+        self.csv_file_path = csv_file_path
+        self.chunk_bytes = chunk_bytes  # bytes searched at once, bounds the scan's index arrays
+        self.encoding = locale.getpreferredencoding(False)  # what open() would decode the file with
+        self.size = os.path.getsize(csv_file_path)
+        self.file = open(csv_file_path, "rb")
+        # an empty file cannot be mapped
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.data = np.frombuffer(self.buffer, dtype=np.uint8)  # a view of the mapping, nothing is copied
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.data = None  # the view has to go before the mapping can close
+        if isinstance(self.buffer, mmap.mmap):
+            try:
+                self.buffer.close()
+            except BufferError:
+                pass  # a scan was left part way, the mapping goes with its last view
+        self.file.close()
+
+    # offsets just past every row's newline, one array per chunk; a newline inside a quoted field is not a row end,
+    # which an even count of quotes before it tells apart (an escaped "" adds two, a quote character in the middle
+    # of an unquoted field throws the count off, blocks() checks every cut against the parse for that reason)
+    def row_ends(self, start=0):
+        open_quote = False  # whether the scan is inside a quoted field at the start of the chunk
+        for chunk_start in range(start, self.size, self.chunk_bytes):
+            chunk = self.data[chunk_start:chunk_start + self.chunk_bytes]
+            newlines = np.flatnonzero(chunk == NEWLINE)
+            quotes = np.flatnonzero(chunk == QUOTE)
+            quotes_before = np.searchsorted(quotes, newlines) + open_quote
+            yield newlines[quotes_before % 2 == 0] + chunk_start + 1
+            open_quote = (len(quotes) + open_quote) % 2 == 1
+
+    # offset where the rows after the header start
+    def header_end(self):
+        for _, end in self.records():
+            return end
+        return self.size  # an empty file
+
+    # data rows of the file, counted without parsing them; when the file holds an odd count of quotes, as a single
+    # quote inside an unquoted field leaves it, the rows are counted by parsing them (two such quotes still fool it)
+    def count_rows(self):
+        start = self.header_end()
+        quotes = sum(int(np.count_nonzero(self.data[chunk_start:chunk_start + self.chunk_bytes] == QUOTE))
+                     for chunk_start in range(start, self.size, self.chunk_bytes))
+        if quotes % 2:
+            return sum(1 for _ in self.records(start))
+        count = sum(len(ends) for ends in self.row_ends(start))
+        if self.size > start and self.data[-1] != NEWLINE:
+            count += 1  # last row without a trailing newline
+        return count
+
+    # most bytes a block may span before the file is read row by row instead, a few times what block_rows lines take
+    # on average from start: a stray quote that stops the quote count finding row ends never leaves a range to the
+    # end of the file to decode in one piece
+    def block_limit(self, block_rows, start):
+        sample = self.data[start:start + self.chunk_bytes]
+        line_bytes = len(sample) / max(int(np.count_nonzero(sample == NEWLINE)), 1)
+        return max(int(4 * block_rows * line_bytes), 1024 * 1024)
+
+    # (start, end) byte ranges of consecutive blocks of at most block_rows rows, from start to the end of the file;
+    # a block that would span more than max_bytes ends the ranges with (start, None)
+    def block_ranges(self, block_rows, start=None, max_bytes=None):
+        block_start = self.header_end() if start is None else start
+        max_bytes = max_bytes or self.size
+        carried = 0  # rows of the current block found in earlier chunks
+        for chunk_start, ends in zip(range(block_start, self.size, self.chunk_bytes), self.row_ends(block_start)):
+            for last_row in range(block_rows - carried - 1, len(ends), block_rows):  # each block's last row
+                block_end = int(ends[last_row])
+                if block_end - block_start > max_bytes:
+                    yield block_start, None
+                    return
+                yield block_start, block_end
+                block_start = block_end
+            carried = (carried + len(ends)) % block_rows
+            if min(chunk_start + self.chunk_bytes, self.size) - block_start > max_bytes:
+                yield block_start, None
+                return
+        if block_start < self.size:
+            yield block_start, self.size  # the rows after the last full block
+
+    # (rows, offset after them) of consecutive blocks of at most block_rows rows from start to the end of the file;
+    # blocks are cut where the quote count finds row ends and kept when they stay within the block limit and their
+    # parse ends on the cut, from the first block that does not the rest of the file is parsed row by row
+    def blocks(self, block_rows, start=None):
+        block_start = self.header_end() if start is None else start
+        for _, block_end in self.block_ranges(block_rows, block_start, self.block_limit(block_rows, block_start)):
+            rows = None if block_end is None else self.rows(block_start, block_end)
+            if rows is None or len(rows) > block_rows:  # the cut splits a quoted field or skipped row ends
+                yield from self.parsed_blocks(block_rows, block_start)
+                return
+            yield rows, block_end
+            block_start = block_end
+
+    # blocks of rows read one by one with csv.reader, for files the quote count gets wrong
+    def parsed_blocks(self, block_rows, start):
+        records = self.records(start)
+        while True:
+            block = list(islice(records, block_rows))
+            if not block:
+                return
+            yield [row for row, _ in block], block[-1][1]
+
+    # (row, offset just past it) of every row from start, csv.reader is fed one line of the file at a time so the
+    # offset after a row is where the parse stopped
+    def records(self, start=0):
+        position = start
+
+        def lines():
+            nonlocal position
+            while position < self.size:
+                end = self.buffer.find(b"\n", position) + 1 or self.size  # the last line may lack a newline
+                with self.slice(position, end) as raw:
+                    line = str(raw, self.encoding)
+                position = end
+                yield line
+
+        for row in csv.reader(lines()):
+            yield row, position
+
+    # the raw bytes of a range, a view of the mapping
+    def slice(self, start, end):
+        return memoryview(self.buffer)[start:end]
+
+    # parsed csv rows of a range, None when the range does not end on a row boundary
+    def rows(self, start, end):
+        with self.slice(start, end) as raw:
+            text = str(raw, self.encoding)
+        rows = list(csv.reader(chain(io.StringIO(text, newline=""), [SENTINEL + "\n"])))
+        return rows[:-1] if rows[-1] == [SENTINEL] else None
+
+    # the header row
+    def header(self):
+        for row, _ in self.records():
+            return row
+        return None
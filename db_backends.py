@@ -0,0 +1,465 @@
+# storage backends: how to connect to an engine and the statements that differ between mysql, sqlite and duckdb
+
+import datetime
+import decimal
+import math
+import os
+import random
+import re
+from abc import ABC, abstractmethod
+
+TYPE_ALIASES = {  # engine type names -> the mysql base type names the schema catalog classifies
+    "integer": "int", "smallint": "int", "tinyint": "tinyint", "hugeint": "bigint", "real": "double",
+    "float": "double", "numeric": "decimal", "timestamp": "datetime", "text": "mediumtext"
+}
+
+
+# lowercase base type of a declared column type, in mysql vocabulary
+def base_type(data_type):
+    name = data_type.lower().split("(")[0].strip()
+    return TYPE_ALIASES.get(name, name)
+
+
+# sample standard deviation aggregate for engines that lack STDDEV_SAMP, single pass (welford)
+class StddevSamp:
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+
+    def step(self, value):
+        if value is None:
+            return
+        self.count += 1
+        delta = float(value) - self.mean
+        self.mean += delta / self.count
+        self.squares += delta * (float(value) - self.mean)
+
+    def finalize(self):
+        return math.sqrt(self.squares / (self.count - 1)) if self.count > 1 else None
+
+
+# statements shared by the sql engines, each backend overrides what its dialect does differently
+class StorageBackend(ABC):
+    name = None
+    placeholder = "?"  # parameter marker of the driver
+    random_condition = "random() < ?"  # row filter keeping each row with the bound probability
+    explain_prefix = "EXPLAIN"
+    errors = (Exception,)  # driver errors that mean the connection or statement failed
+
+    # quote a table or column name
+    @staticmethod
+    def quote(identifier):
+        return '"' + identifier.replace('"', '""') + '"'
+
+    # engine column type for a type inferred at upload
+    def column_type(self, column_type):
+        return column_type
+
+    # parameterized insert of a full row
+    def insert_query(self, table_name, column_count):
+        placeholders = ", ".join([self.placeholder] * column_count)
+        return f"INSERT INTO {self.quote(table_name)} VALUES ({placeholders})"
+
+    # cursor of a connection, options the driver does not know are dropped
+    def cursor(self, conn, **cursor_options):
+        return conn.cursor()
+
+    # raise if a connection is no longer usable
+    def ping(self, conn, attempts, delay):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+    # whether uploads can hand the whole file to the server in one statement
+    def local_infile_enabled(self, cursor):
+        return False
+
+    # key of a secondary index on a column, text columns longer than the limit are indexed by a prefix
+    def index_key(self, column_name, length, prefix_limit):
+        return self.quote(column_name)
+
+    # id the engine gives the session of a connection, needed to cancel its statement from another connection
+    def session_id(self, conn):
+        return None
+
+    # stop the statement running on a connection from another thread, embedded engines interrupt it directly
+    def cancel(self, conn, session_id, open_connection):
+        conn.interrupt()
+
+    # insert rows one at a time in the open transaction, a row the engine rejects is undone alone through a
+    # savepoint; returns (offset, error) of the rejected rows. The batch savepoint keeps sqlite from committing
+    # when a row's savepoint is released, the caller commits or rolls back the batch
+    def insert_rows(self, conn, cursor, insert_query, rows):
+        failed_rows = []
+        cursor.execute("SAVEPOINT chatdb_batch")
+        for offset, row in enumerate(rows):
+            cursor.execute("SAVEPOINT chatdb_row")
+            try:
+                cursor.execute(insert_query, row)
+            except Exception as row_error:  # catch row-specific errors
+                cursor.execute("ROLLBACK TO SAVEPOINT chatdb_row")
+                failed_rows.append((offset, row_error))
+            cursor.execute("RELEASE SAVEPOINT chatdb_row")
+        return failed_rows
+
+    @abstractmethod
+    def open_connection(self, settings):
+        pass
+
+    # table names in the database
+    @abstractmethod
+    def list_tables(self, cursor, database):
+        pass
+
+    # value that changes whenever a table is created or dropped, a tuple starting with the table count
+    @abstractmethod
+    def fingerprint(self, cursor, database):
+        pass
+
+    # (table, column, base type) of every table, or of one table, in column order
+    @abstractmethod
+    def describe_columns(self, cursor, database, table_name=None):
+        pass
+
+    # lowercase columns leading an index, and lowercase column -> character length (None when not text)
+    @abstractmethod
+    def index_metadata(self, cursor, database, table_name):
+        pass
+
+
+class MySQLBackend(StorageBackend):
+    name = "mysql"
+    placeholder = "%s"
+    random_condition = "RAND() < %s"
+
+    def __init__(self):
+        import mysql.connector  # only needed when mysql is the configured backend
+        self.driver = mysql.connector
+        self.errors = (mysql.connector.Error,)
+
+    @staticmethod
+    def quote(identifier):
+        return "`" + identifier.replace("`", "``") + "`"
+
+    def cursor(self, conn, **cursor_options):
+        return conn.cursor(**cursor_options)
+
+    def ping(self, conn, attempts, delay):
+        conn.ping(reconnect=True, attempts=attempts, delay=delay)
+
+    def session_id(self, conn):
+        return conn.connection_id
+
+    # the blocked connection cannot send anything, KILL QUERY goes over a fresh one since the pool may be exhausted
+    def cancel(self, conn, session_id, open_connection):
+        side_conn = open_connection()
+        try:
+            cursor = side_conn.cursor()
+            cursor.execute(f"KILL QUERY {int(session_id)};")
+            cursor.close()
+        finally:
+            side_conn.close()
+
+    def open_connection(self, settings):
+        return self.driver.connect(
+            host=settings["host"],
+            user=settings["user"],
+            password=settings["password"],
+            database=settings["database"],
+            allow_local_infile=settings["allow_local_infile"]  # needed for LOAD DATA LOCAL INFILE uploads
+        )
+
+    def local_infile_enabled(self, cursor):
+        cursor.execute("SHOW GLOBAL VARIABLES LIKE 'local_infile';")
+        result = cursor.fetchone()
+        return bool(result) and str(result[1]).upper() in ("ON", "1")
+
+    def index_key(self, column_name, length, prefix_limit):
+        if length and length > prefix_limit:
+            return f"{self.quote(column_name)}({prefix_limit})"
+        return self.quote(column_name)
+
+    def list_tables(self, cursor, database):
+        cursor.execute("SHOW TABLES;")
+        return [table[0] for table in cursor.fetchall()]
+
+    def fingerprint(self, cursor, database):
+        cursor.execute("SELECT COUNT(*), MAX(CREATE_TIME) FROM INFORMATION_SCHEMA.TABLES "
+                       "WHERE TABLE_SCHEMA = %s;", (database,))
+        return tuple(cursor.fetchone())
+
+    def describe_columns(self, cursor, database, table_name=None):
+        query = "SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = %s"
+        params = (database,)
+        if table_name is not None:
+            query += " AND TABLE_NAME = %s"
+            params += (table_name,)
+        cursor.execute(query + " ORDER BY TABLE_NAME, ORDINAL_POSITION;", params)
+        return [(table, column, base_type(data_type)) for table, column, data_type in cursor.fetchall()]
+
+    def index_metadata(self, cursor, database, table_name):
+        cursor.execute("SELECT DISTINCT COLUMN_NAME FROM INFORMATION_SCHEMA.STATISTICS "
+                       "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND SEQ_IN_INDEX = 1;", (database, table_name))
+        indexed = {row[0].lower() for row in cursor.fetchall()}
+        cursor.execute("SELECT COLUMN_NAME, CHARACTER_MAXIMUM_LENGTH FROM INFORMATION_SCHEMA.COLUMNS "
+                       "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s;", (database, table_name))
+        return indexed, {row[0].lower(): row[1] for row in cursor.fetchall()}
+
+
+# embedded single-file engine from the standard library, for local sessions and ci
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+    random_condition = "(RANDOM() / 18446744073709551616.0 + 0.5) < ?"  # RANDOM() is a signed 64-bit integer
+    explain_prefix = "EXPLAIN QUERY PLAN"
+
+    def __init__(self):
+        import sqlite3
+        self.driver = sqlite3
+        self.errors = (sqlite3.Error,)
+        # typed values from parquet and arrow uploads, stored the way their csv text would be
+        sqlite3.register_adapter(decimal.Decimal, str)
+        sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+        sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(" "))
+
+    def open_connection(self, settings):
+        path = settings["sqlite_path"]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # pooled connections move between threads, sqlite serializes the writers itself
+        conn = self.driver.connect(path, timeout=30, check_same_thread=False)
+        conn.create_function("SQRT", 1, lambda value: math.sqrt(value) if value is not None and value >= 0 else None)
+        conn.create_function("RAND", 0, random.random)
+        conn.create_aggregate("STDDEV_SAMP", 1, StddevSamp)
+        return conn
+
+    def list_tables(self, cursor, database):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+                       "ORDER BY name;")
+        return [table[0] for table in cursor.fetchall()]
+
+    def fingerprint(self, cursor, database):
+        # schema_version is bumped by every schema change
+        cursor.execute("SELECT COUNT(*), (SELECT schema_version FROM pragma_schema_version) FROM sqlite_master "
+                       "WHERE type = 'table' AND name NOT LIKE 'sqlite_%';")
+        return tuple(cursor.fetchone())
+
+    def describe_columns(self, cursor, database, table_name=None):
+        query = ("SELECT m.name, p.name, p.type FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p "
+                 "WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'")
+        params = ()
+        if table_name is not None:
+            query += " AND m.name = ?"
+            params = (table_name,)
+        cursor.execute(query + " ORDER BY m.name, p.cid;", params)
+        return [(table, column, base_type(data_type)) for table, column, data_type in cursor.fetchall()]
+
+    def index_metadata(self, cursor, database, table_name):
+        cursor.execute("SELECT ii.name FROM pragma_index_list(?) AS il JOIN pragma_index_info(il.name) AS ii "
+                       "WHERE ii.seqno = 0;", (table_name,))
+        indexed = {row[0].lower() for row in cursor.fetchall() if row[0]}
+        cursor.execute("SELECT name FROM pragma_table_info(?);", (table_name,))
+        return indexed, {row[0].lower(): None for row in cursor.fetchall()}  # text needs no key prefix
+
+
+DATA_CHANGE = re.compile(r"^\s*(?:INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+SCHEMA_CHANGE = re.compile(r"^\s*(?:CREATE|DROP|ALTER|TRUNCATE)\b", re.IGNORECASE)
+INSERT_VALUES = re.compile(r"^\s*INSERT\b.*\bVALUES\s*(\([^()]*\))\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+
+
+# cursor over a duckdb connection with the transaction rules of the python sqlite3 module: data changes open a
+# transaction that lasts until commit or rollback, schema changes and reads run on their own
+class DuckDBCursor:
+    ROWS_PER_STATEMENT = 500
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    @property
+    def description(self):
+        return self.connection.database.description
+
+    @property
+    def rowcount(self):
+        return self.connection.database.rowcount
+
+    def execute(self, query, params=None):
+        if DATA_CHANGE.match(query):
+            self.connection.begin()
+        elif SCHEMA_CHANGE.match(query):
+            self.connection.commit()  # like mysql, a schema change commits pending work first
+        self.connection.database.execute(query, params or [])
+
+    # duckdb runs executemany one statement per row, inserts are sent as multi-row VALUES lists instead
+    def executemany(self, query, rows):
+        self.connection.begin()
+        values = INSERT_VALUES.search(query)
+        if values is None:
+            self.connection.database.executemany(query, rows)
+            return
+        rows = list(rows)
+        for start in range(0, len(rows), self.ROWS_PER_STATEMENT):
+            chunk = rows[start:start + self.ROWS_PER_STATEMENT]
+            statement = query[:values.start(1)] + ", ".join([values.group(1)] * len(chunk))
+            self.connection.database.execute(statement, [value for row in chunk for value in row])
+
+    def fetchone(self):
+        return self.connection.database.fetchone()
+
+    def fetchmany(self, size):
+        return self.connection.database.fetchmany(size)
+
+    def fetchall(self):
+        return self.connection.database.fetchall()
+
+    def close(self):
+        pass
+
+
+# duckdb connection with the commit/rollback behaviour the rest of chatdb expects from a dbapi connection
+class DuckDBConnection:
+
+    def __init__(self, database):
+        self.database = database
+        self.in_transaction = False
+
+    def begin(self):
+        if not self.in_transaction:
+            self.database.begin()
+            self.in_transaction = True
+
+    def cursor(self, **cursor_options):
+        return DuckDBCursor(self)
+
+    def commit(self):
+        if self.in_transaction:
+            self.database.commit()
+            self.in_transaction = False
+
+    def rollback(self):
+        if self.in_transaction:
+            self.database.rollback()
+            self.in_transaction = False
+
+    def interrupt(self):
+        self.database.interrupt()
+
+    def close(self):
+        self.database.close()
+
+
+# embedded columnar engine, aggregates scan only the columns they read; needs the optional duckdb package
+class DuckDBBackend(StorageBackend):
+    name = "duckdb"
+    MAX_DECIMAL_PRECISION = 38
+
+    def __init__(self):
+        import duckdb  # optional dependency, only needed when duckdb is the configured backend
+        self.driver = duckdb
+        self.errors = (duckdb.Error,)
+
+    def open_connection(self, settings):
+        path = settings["duckdb_path"]
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return DuckDBConnection(self.driver.connect(path))  # connections to one file share its database instance
+
+    # duckdb has no savepoints and a failed statement aborts the whole transaction: the rejected rows are found by
+    # bisecting the rows with inserts that are rolled back, then the others are inserted at once; rows rejected only
+    # together (a key repeated in the rows) are left to replay_rows
+    def insert_rows(self, conn, cursor, insert_query, rows):
+        failed_rows = []
+        middle = len(rows) // 2  # the caller already saw all of the rows fail together
+        segments = [(middle, rows[middle:]), (0, rows[:middle])] if len(rows) > 1 else [(0, rows)]
+        while segments:
+            start, segment = segments.pop()  # leftmost first, the failures come out in row order
+            try:
+                cursor.executemany(insert_query, segment)
+                segment_error = None
+            except Exception as error:
+                segment_error = error
+            conn.rollback()
+            if segment_error is None:
+                continue
+            if len(segment) == 1:
+                failed_rows.append((start, segment_error))
+                continue
+            middle = len(segment) // 2
+            segments += [(start + middle, segment[middle:]), (start, segment[:middle])]
+        failed_offsets = {offset for offset, _ in failed_rows}
+        accepted_rows = [row for offset, row in enumerate(rows) if offset not in failed_offsets]
+        try:
+            if accepted_rows:
+                cursor.executemany(insert_query, accepted_rows)
+        except Exception:
+            conn.rollback()
+            return self.replay_rows(conn, cursor, insert_query, rows)
+        return failed_rows
+
+    # insert rows one at a time, after a rejected row roll back and insert the rows accepted so far again
+    def replay_rows(self, conn, cursor, insert_query, rows):
+        accepted_rows = []
+        failed_rows = []
+        for offset, row in enumerate(rows):
+            try:
+                cursor.execute(insert_query, row)
+                accepted_rows.append(row)
+            except Exception as row_error:  # catch row-specific errors
+                conn.rollback()
+                failed_rows.append((offset, row_error))
+                if accepted_rows:
+                    cursor.executemany(insert_query, accepted_rows)
+        return failed_rows
+
+    def column_type(self, column_type):
+        upper = column_type.upper()
+        if upper == "DATETIME":
+            return "TIMESTAMP"
+        match = re.match(r"DECIMAL\((\d+),\s*(\d+)\)", upper)
+        if match and int(match.group(1)) > self.MAX_DECIMAL_PRECISION:
+            return "HUGEINT" if match.group(2) == "0" else "DOUBLE"
+        return column_type
+
+    def list_tables(self, cursor, database):
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'main' "
+                       "AND table_type = 'BASE TABLE' ORDER BY table_name;")
+        return [table[0] for table in cursor.fetchall()]
+
+    def fingerprint(self, cursor, database):
+        cursor.execute("SELECT COUNT(*), MAX(table_oid) FROM duckdb_tables();")
+        return tuple(cursor.fetchone())
+
+    def describe_columns(self, cursor, database, table_name=None):
+        query = ("SELECT table_name, column_name, data_type FROM information_schema.columns "
+                 "WHERE table_schema = 'main'")
+        params = []
+        if table_name is not None:
+            query += " AND table_name = ?"
+            params = [table_name]
+        cursor.execute(query + " ORDER BY table_name, ordinal_position;", params)
+        return [(table, column, base_type(data_type)) for table, column, data_type in cursor.fetchall()]
+
+    def index_metadata(self, cursor, database, table_name):
+        cursor.execute("SELECT expressions FROM duckdb_indexes() WHERE table_name = ?;", [table_name])
+        indexed = set()
+        for (expressions,) in cursor.fetchall():
+            first = re.search(r"\"?(\w+)", str(expressions))  # stored as a list of column expressions
+            if first:
+                indexed.add(first.group(1).lower())
+        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = ?;", [table_name])
+        return indexed, {row[0].lower(): None for row in cursor.fetchall()}
+
+
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend, "duckdb": DuckDBBackend}
+
+
+# backend instance by name
+def get_backend(name):
+    try:
+        return BACKENDS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown storage backend '{name}', expected one of {', '.join(BACKENDS)}")
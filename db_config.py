@@ -6,3 +6,75 @@ config = {
     'password': 'lagoona88',
     'database': 'chatdb'
 }
+
+# storage engine: 'mysql' uses the server above, 'sqlite' and 'duckdb' run in-process on a local file
+backend_config = {
+    'backend': 'mysql',
+    'sqlite_path': '.chatdb/chatdb.sqlite3',
+    'duckdb_path': '.chatdb/chatdb.duckdb'  # needs the optional duckdb package
+}
+
+# dataset upload settings
+upload_config = {
+    'batch_size': 5000,  # rows sent per executemany call and committed together
+    'queue_size': 4,  # batches buffered between pipeline stages, bounds upload memory
+    'use_load_data': False,  # use LOAD DATA LOCAL INFILE when the server allows it
+    'profile_block_size': 10000,  # rows classified together while scanning a file for its schema
+    'reservoir_size': 1000,  # uniformly sampled rows kept from the schema scan
+    'lexicon_max_distinct': 50,  # text columns with at most this many values get their values indexed
+    'parallel_workers': 4  # partition files profiled in processes and loaded on pooled connections at once
+}
+
+# in-process cache settings
+cache_config = {
+    'table_revalidate_seconds': 5,  # how long the cached table list is trusted before a fingerprint check
+    'artifact_dir': '.chatdb',  # where per-table artifacts built at upload time are stored
+    'intent_cache_size': 1024,  # questions whose generated sql is kept
+    'result_cache_bytes': 64 * 1024 * 1024,  # memory budget for cached query results
+    'result_ttl_seconds': 300  # cached results older than this are re-run
+}
+
+# connection pool settings
+pool_config = {
+    'pool_size': 5,  # pooled connections for uploads and concurrent queries, besides the session connection
+    'max_retries': 3,  # reconnect attempts before giving up
+    'backoff_seconds': 0.5,  # first retry delay, doubled on every attempt
+    'health_check_seconds': 30  # idle time after which a connection is pinged before use
+}
+
+# query result display settings
+display_config = {
+    'page_size': 50,  # rows fetched and printed per page
+    'row_cap': 1000  # rows printed for one query before the rest is skipped, only fully shown results are cached
+}
+
+# query execution settings
+query_config = {
+    'timeout_seconds': 30,  # statements running longer are cancelled, None or 0 to wait indefinitely
+    'poll_seconds': 0.1,  # how often a running query is checked for timeout and redraws the spinner
+    'spinner_after_seconds': 0.5  # queries finishing sooner show no progress spinner
+}
+
+# approximate query settings
+approximate_config = {
+    'min_table_rows': 1000000,  # tables with fewer rows are fast enough exactly and get no sample table
+    'sample_rows': 100000  # expected rows of a sample table, the inclusion probability follows from it
+}
+
+# index advisor settings
+index_config = {
+    'min_uses': 3,  # filter, group and sort uses of a column before an index on it is recommended
+    'auto_create': False  # build recommended indexes in the background as soon as they qualify
+}
+
+# query tracing settings
+tracing_config = {
+    'max_spans': 100000,  # stage timings kept in memory for the session percentiles
+    'jsonl_path': None,  # file every stage timing is appended to as a json line, None to disable
+    'prometheus_path': None  # file the session summary is written to in prometheus text format, None to disable
+}
+
+# sample query settings
+sample_query_config = {
+    'group_by_max_distinct': 100  # categorical columns with more distinct values are not used for GROUP BY examples
+}
@@ -1,7 +1,11 @@
 # setup database connection to application
 
-import mysql.connector
-from db_config import config
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from db_config import config, upload_config, pool_config, backend_config
+from db_backends import get_backend
 
 
 class DatabaseConnection:
@@ -12,26 +16,63 @@ class DatabaseConnection:
         self.password = config["password"]
         self.database = config["database"]
         self.connection = None
+        self.backend = get_backend(backend_config["backend"])  # engine specific connect, metadata and dialect
+
+        # pooled connections for work that should not share the session connection
+        self.pool_size = pool_config["pool_size"]
+        self.max_retries = pool_config["max_retries"]
+        self.backoff_seconds = pool_config["backoff_seconds"]
+        self.health_check_seconds = pool_config["health_check_seconds"]
+        self.idle_connections = queue.LifoQueue()  # (connection, last used time), most recent first
+        self.created_count = 0  # pooled connections currently open, idle or checked out
+        self.pool_lock = threading.Lock()
+        self.last_used = 0.0  # when the session connection last handed out a cursor
+
+    # open a new connection with the configured credentials or database file
+    def open_connection(self):
+        return self.backend.open_connection(dict(config, **backend_config,
+                                                 allow_local_infile=upload_config["use_load_data"]))
+
+    # open a connection, retrying with exponential backoff when the server is unreachable
+    def open_connection_with_retry(self):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.open_connection()
+            except self.backend.errors:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_seconds * 2 ** attempt)
+
+    # make sure a connection that sat idle is still alive, reconnecting with backoff if it dropped
+    def ensure_healthy(self, conn, last_used):
+        if time.monotonic() - last_used < self.health_check_seconds:
+            return conn  # recently used, skip the round trip
+        try:
+            self.backend.ping(conn, attempts=self.max_retries + 1, delay=self.backoff_seconds)
+            return conn
+        except self.backend.errors:
+            try:
+                conn.close()
+            except self.backend.errors:
+                pass
+            return self.open_connection_with_retry()
 
     def connect(self):
         try:
             # setup connection
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
+            self.connection = self.open_connection_with_retry()
+            self.last_used = time.monotonic()
             print("-" * 300)
             print("\033[1m" + "Welcome to ChatDB 98" + "\033[0m")
             print("\033[1m" + "Learn how to query databases like a pro!" + "\033[0m")
             print()
         # output error statement if not able to connect to database
-        except mysql.connector.Error as err:
+        except self.backend.errors as err:
             print(f"Error: {err}")
             self.connection = None
 
     def disconnect(self):
+        self.close_pool()
         if self.connection:
             self.connection.close()  # disconnect message
             print("Thank you for using ChatDB!")
@@ -40,6 +81,99 @@ class DatabaseConnection:
 
     def get_cursor(self):
         if self.connection:
-            return self.connection.cursor()
+            self.connection = self.ensure_healthy(self.connection, self.last_used)  # reconnect if dropped
+            self.last_used = time.monotonic()
+            return self.backend.cursor(self.connection)
         else:
             raise ConnectionError("Database connection unsuccessful :(")  # case of being unable to connect to server
+
+    # check a connection out of the pool, blocking until one is free once pool_size connections exist
+    def acquire(self, timeout=None):
+        try:
+            conn, last_used = self.idle_connections.get_nowait()
+            return self.checkout(conn, last_used)
+        except queue.Empty:
+            pass
+        with self.pool_lock:
+            can_create = self.created_count < self.pool_size
+            if can_create:
+                self.created_count += 1
+        if can_create:
+            try:
+                return self.open_connection_with_retry()
+            except Exception:
+                with self.pool_lock:
+                    self.created_count -= 1
+                raise
+        try:
+            conn, last_used = self.idle_connections.get(timeout=timeout)
+        except queue.Empty:
+            raise ConnectionError("No pooled database connection became available.")
+        return self.checkout(conn, last_used)
+
+    # health check a connection taken from the idle queue
+    def checkout(self, conn, last_used):
+        try:
+            return self.ensure_healthy(conn, last_used)
+        except Exception:
+            with self.pool_lock:
+                self.created_count -= 1  # the slot is free again for a fresh connection
+            raise
+
+    # return a connection to the pool, discarding any uncommitted work
+    def release(self, conn):
+        try:
+            conn.rollback()
+        except self.backend.errors:
+            try:
+                conn.close()
+            except self.backend.errors:
+                pass
+            with self.pool_lock:
+                self.created_count -= 1
+            return
+        self.idle_connections.put((conn, time.monotonic()))
+
+    # close a checked-out connection instead of returning it, e.g. when it still has unread rows
+    def discard(self, conn):
+        try:
+            conn.close()
+        except self.backend.errors:
+            pass
+        with self.pool_lock:
+            self.created_count -= 1
+
+    # close every idle pooled connection
+    def close_pool(self):
+        while True:
+            try:
+                conn, _ = self.idle_connections.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except self.backend.errors:
+                pass
+            with self.pool_lock:
+                self.created_count -= 1
+
+    # pooled connection for the duration of a with block
+    @contextmanager
+    def pooled_connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    # cursor on a pooled connection, committed on success and closed when the with block ends
+    @contextmanager
+    def cursor(self, commit=False, **cursor_options):
+        with self.pooled_connection() as conn:
+            cursor = self.backend.cursor(conn, **cursor_options)
+            try:
+                yield cursor
+                if commit:
+                    conn.commit()
+            finally:
+                cursor.close()
@@ -0,0 +1,153 @@
+# records which columns queries filter, group and sort on, and recommends and builds secondary indexes for them
+
+import re
+import threading
+from db_config import index_config
+from schema_catalog import SchemaCatalog
+from artifact_store import ArtifactStore
+
+CLAUSE_PATTERN = re.compile(r"\b(WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT)\b", re.IGNORECASE)
+CLAUSE_USES = {"WHERE": "filter", "GROUP BY": "group", "ORDER BY": "sort"}  # clause -> usage kind
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")  # values are never column references
+IDENTIFIER = re.compile(r"[`\"]([^`\"]+)[`\"]|\b([A-Za-z_]\w*)\b")
+USE_KINDS = ("filter", "group", "sort")
+MAX_KEY_PREFIX = 191  # characters of a text column indexed, fits the innodb key limit in utf8mb4
+
+
+# columns of a table a query filters, groups or sorts on: {"filter": set, "group": set, "sort": set}
+def clause_columns(sql_query, column_names):
+    lookup = {name.lower(): name for name in column_names}
+    uses = {kind: set() for kind in USE_KINDS}
+    parts = CLAUSE_PATTERN.split(STRING_LITERAL.sub("''", sql_query))  # text, keyword, body, keyword, body...
+    for keyword, body in zip(parts[1::2], parts[2::2]):
+        kind = CLAUSE_USES.get(" ".join(keyword.upper().split()))
+        if kind is None:
+            continue
+        for match in IDENTIFIER.finditer(body):
+            name = lookup.get((match.group(1) or match.group(2)).lower())
+            if name:  # aliases, functions and keywords are not columns of the table
+                uses[kind].add(name)
+    return uses
+
+
+class IndexAdvisor:
+
+    def __init__(self, db_connection, schema_catalog=None):
+        self.db_connection = db_connection
+        self.schema_catalog = schema_catalog or SchemaCatalog(db_connection)  # cached column metadata
+        # on upload or remove the cached usage is dropped and reloaded from the artifact, which a removed table loses
+        self.schema_catalog.add_listener(self.forget_table)
+        self.artifact_store = ArtifactStore(db_connection.database)  # usage counts survive restarts
+        # table name -> column -> {"filter": n, "group": n, "sort": n, "example": last query using it}
+        self.usage = {}
+        self.building = set()  # (table, column) indexes being created in the background
+        self.reports = []  # finished background builds: dicts with the plans before and after, or the error
+        self.lock = threading.Lock()
+
+    # forget recorded usage of a table, or of every table when none is given
+    def forget_table(self, table_name=None):
+        with self.lock:
+            if table_name is None:
+                self.usage = {}
+            else:
+                self.usage.pop(table_name.lower(), None)
+
+    # usage counts of a table, loaded from its artifact on first use
+    def table_usage(self, table_name):
+        key = table_name.lower()
+        if key not in self.usage:
+            self.usage[key] = self.artifact_store.load("index_usage", table_name) or {}
+        return self.usage[key]
+
+    # count the filter, group and sort columns of a query run or suggested on a table
+    def record(self, table_name, sql_query):
+        column_names = [name for name, _ in self.schema_catalog.get_columns(table_name)]
+        uses = clause_columns(sql_query, column_names)
+        if not any(uses.values()):
+            return
+        with self.lock:
+            usage = self.table_usage(table_name)
+            for kind, columns in uses.items():
+                for column_name in columns:
+                    counts = usage.setdefault(column_name, {"filter": 0, "group": 0, "sort": 0})
+                    counts[kind] += 1
+                    counts["example"] = sql_query  # plans are compared on the latest query using the column
+            self.artifact_store.save("index_usage", table_name, usage)
+        if index_config["auto_create"]:
+            for recommendation in self.recommend(table_name):
+                self.create_index(table_name, recommendation)
+
+    # columns that lead an existing index, and the character length of every text column
+    def index_metadata(self, table_name):
+        with self.db_connection.cursor(buffered=True) as cursor:
+            return self.db_connection.backend.index_metadata(cursor, self.db_connection.database, table_name)
+
+    # secondary indexes worth creating on a table, most used columns first
+    def recommend(self, table_name):
+        with self.lock:
+            usage = {column_name: dict(counts) for column_name, counts in self.table_usage(table_name).items()}
+            building = set(self.building)
+        candidates = [(column_name, counts) for column_name, counts in usage.items()
+                      if sum(counts[kind] for kind in USE_KINDS) >= index_config["min_uses"]]
+        if not candidates:
+            return []
+        indexed, lengths = self.index_metadata(table_name)
+        backend = self.db_connection.backend
+        recommendations = []
+        for column_name, counts in candidates:
+            if column_name.lower() in indexed or (table_name.lower(), column_name.lower()) in building:
+                continue
+            if column_name.lower() not in lengths:
+                continue  # column no longer exists
+            key = backend.index_key(column_name, lengths[column_name.lower()], MAX_KEY_PREFIX)
+            index_name = f"idx_{table_name}_{column_name}"[:64]  # mysql identifier limit
+            recommendations.append({
+                "column": column_name, "uses": {kind: counts[kind] for kind in USE_KINDS},
+                "example": counts["example"], "index_name": index_name,
+                "ddl": f"CREATE INDEX {backend.quote(index_name)} ON {backend.quote(table_name)} ({key});"
+            })
+        recommendations.sort(key=lambda item: sum(item["uses"].values()), reverse=True)
+        return recommendations
+
+    # EXPLAIN of a query as (column names, rows)
+    def explain(self, sql_query):
+        with self.db_connection.cursor(buffered=True) as cursor:
+            cursor.execute(f"{self.db_connection.backend.explain_prefix} {sql_query}")
+            return [desc[0] for desc in cursor.description], cursor.fetchall()
+
+    # build a recommended index, in a background thread unless wait is set; the report keeps both plans
+    def create_index(self, table_name, recommendation, wait=False):
+        key = (table_name.lower(), recommendation["column"].lower())
+        if not wait:
+            with self.lock:
+                if key in self.building:
+                    return None  # already being built
+                self.building.add(key)
+            thread = threading.Thread(target=self.create_in_background, args=(table_name, recommendation),
+                                      daemon=True)
+            thread.start()
+            return thread
+        report = {"table": table_name, "index_name": recommendation["index_name"], "ddl": recommendation["ddl"],
+                  "query": recommendation["example"]}
+        report["before"] = self.explain(recommendation["example"])
+        with self.db_connection.cursor(commit=True) as cursor:
+            cursor.execute(recommendation["ddl"])
+        report["after"] = self.explain(recommendation["example"])
+        return report
+
+    # background build, the report or the error is kept for the advisor menu
+    def create_in_background(self, table_name, recommendation):
+        try:
+            report = self.create_index(table_name, recommendation, wait=True)
+        except Exception as e:
+            report = {"table": table_name, "index_name": recommendation["index_name"], "ddl": recommendation["ddl"],
+                      "error": str(e)}
+        with self.lock:
+            self.building.discard((table_name.lower(), recommendation["column"].lower()))
+            self.reports.append(report)
+
+    # finished background builds since the last call
+    def take_reports(self):
+        with self.lock:
+            reports, self.reports = self.reports, []
+        return reports
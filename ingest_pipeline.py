@@ -0,0 +1,229 @@
+# streaming csv ingestion: reader -> type coercion -> writer stages joined by bounded queues
+
+import queue
+import threading
+import time
+from functools import partial
+from input_formats import read_blocks_from, is_columnar
+
+_END = object()  # marks the end of the stream between stages
+
+
+# insert one batch with a single executemany call, isolating the failing rows if the batch is rejected;
+# before_commit(inserted, failed) runs in the batch's transaction, eg. to advance the upload checkpoint, and its errors
+# fail the batch instead of being taken for rejected rows
+def insert_batch(backend, conn, cursor, insert_query, batch, first_row_idx, before_commit=None):
+    try:
+        cursor.executemany(insert_query, batch)  # multi-row insert for the whole batch
+        failed_rows = []
+    except Exception:
+        conn.rollback()  # undo the partial batch and retry row by row to find the bad rows
+        failed_rows = [(first_row_idx + offset, row_error)
+                       for offset, row_error in backend.insert_rows(conn, cursor, insert_query, batch)]
+    inserted_count = len(batch) - len(failed_rows)
+    if before_commit:
+        before_commit(inserted_count, failed_rows)
+    conn.commit()  # commit per batch, keeping the good rows of a rejected one
+    return inserted_count, failed_rows
+
+
+# print the running row count, percent complete when the total is known, and insert rate on a single line
+def report_progress(inserted_count, start_time, total_rows=None):
+    elapsed = time.perf_counter() - start_time
+    rate = inserted_count / elapsed if elapsed > 0 else 0
+    done = f" of {total_rows:,}" if total_rows else ""
+    percent = f"{inserted_count / total_rows:.0%}, " if total_rows else ""
+    print(f"\rInserted {inserted_count:,}{done} rows ({percent}{rate:,.0f} rows/sec)", end="", flush=True)
+
+
+# empty numeric and datetime values become NULL instead of failing in strict mode
+def coerce_number(value):
+    value = value.strip()
+    return value if value else None
+
+
+# MM/DD/YYYY dates are rewritten to the YYYY-MM-DD form MySQL expects, other values (iso dates and datetimes) pass
+# through and malformed ones are left for the insert to reject row by row
+def coerce_date(value):
+    value = value.strip()
+    if not value:
+        return None
+    parts = value.split("/")
+    if len(parts) == 3:
+        month, day, year = parts
+        return f"{year}-{month}-{day}"
+    return value
+
+
+# true/false text becomes 1/0 for BOOLEAN columns
+def coerce_boolean(value):
+    value = value.strip().lower()
+    if not value:
+        return None
+    return 1 if value == "true" else 0
+
+
+# pick the coercion function for a MySQL column type, None means the value is inserted as-is
+def get_coercer(column_type):
+    base_type = column_type.split("(")[0].upper()
+    if base_type in ("INT", "BIGINT", "DECIMAL"):
+        return coerce_number
+    if base_type in ("DATE", "DATETIME"):  # a datetime column can also hold plain MM/DD/YYYY dates
+        return coerce_date
+    if base_type == "BOOLEAN":
+        return coerce_boolean
+    return None
+
+
+# LOAD DATA transform of a value read into a user variable that does what the column's coercer does, so a file
+# loaded by the server gives the same table as one loaded through the pipeline
+def load_data_expression(column_type, variable):
+    value = f"TRIM({variable})"
+    coercer = get_coercer(column_type)
+    if coercer is coerce_number:
+        return f"NULLIF({value}, '')"
+    if coercer is coerce_date:
+        month, day_and_year = f"SUBSTRING_INDEX({value}, '/', 1)", f"SUBSTRING_INDEX({value}, '/', -2)"
+        day, year = f"SUBSTRING_INDEX({day_and_year}, '/', 1)", f"SUBSTRING_INDEX({value}, '/', -1)"
+        return (f"CASE WHEN {value} = '' THEN NULL "
+                f"WHEN CHAR_LENGTH({value}) - CHAR_LENGTH(REPLACE({value}, '/', '')) = 2 "
+                f"THEN CONCAT({year}, '-', {month}, '-', {day}) ELSE {value} END")
+    if coercer is coerce_boolean:
+        return f"CASE LOWER({value}) WHEN '' THEN NULL WHEN 'true' THEN 1 ELSE 0 END"
+    return variable
+
+
+class IngestionPipeline:
+
+    def __init__(self, db_connection, batch_size=5000, queue_size=4, progress=None, checkpoint=None):
+        self.db_connection = db_connection
+        self.progress = progress  # called with the rows of every inserted batch instead of printing progress
+        self.checkpoint = checkpoint  # where the file's load stands, advanced with every committed batch
+        self.batch_size = batch_size  # rows per batch handed between stages and committed together
+        self.queue_size = queue_size  # batches buffered between two stages, bounds memory use
+        self.stop_event = threading.Event()  # set when any stage fails so the others wind down
+        self.errors = []  # fatal errors raised inside the worker stages
+
+    # put an item on a bounded queue without blocking forever if a downstream stage has died
+    def put(self, target_queue, item):
+        while not self.stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # get an item from a queue, giving up once the pipeline is stopping
+    def get(self, source_queue):
+        while not self.stop_event.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    # coercion stage: convert raw csv strings into values suited to each column type
+    def coerce_stage(self, coercers, in_queue, out_queue):
+        try:
+            converters = [(idx, coercer) for idx, coercer in enumerate(coercers) if coercer]
+            while True:
+                item = self.get(in_queue)
+                if item is _END:
+                    break
+                first_row_idx, batch, offset = item
+                if converters:
+                    for row in batch:
+                        for idx, coercer in converters:
+                            if idx < len(row):
+                                row[idx] = coercer(row[idx])
+                if not self.put(out_queue, (first_row_idx, batch, offset)):
+                    return
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+            return
+        self.put(out_queue, _END)
+
+    # move the checkpoint past a batch in the transaction that inserts it
+    def advance_checkpoint(self, cursor, row_count, offset, inserted, failed):
+        self.checkpoint.advance(cursor, row_count, offset, inserted, len(failed))
+
+    # writer stage: insert batches on a dedicated connection so it never waits on the parser
+    def write_stage(self, insert_query, in_queue, stats):
+        conn = None
+        try:
+            conn = self.db_connection.acquire()  # pooled connection, separate from the session connection
+            cursor = conn.cursor()
+            try:
+                while True:
+                    item = self.get(in_queue)
+                    if item is _END:
+                        break
+                    first_row_idx, batch, offset = item
+                    before_commit = (partial(self.advance_checkpoint, cursor, len(batch), offset) if self.checkpoint
+                                     else None)
+                    inserted, failed = insert_batch(self.db_connection.backend, conn, cursor, insert_query, batch,
+                                                    first_row_idx, before_commit)
+                    stats["inserted"] += inserted
+                    stats["failed"].extend(failed)
+                    if self.progress:
+                        self.progress(inserted)
+                    else:
+                        report_progress(stats["inserted"], stats["start_time"], stats["total_rows"])
+            finally:
+                cursor.close()
+        except Exception as e:
+            self.errors.append(e)
+            self.stop_event.set()
+        finally:
+            if conn:
+                self.db_connection.release(conn)
+
+    # stream a csv, parquet or arrow file into an existing table whose column types (in header order) drive coercion;
+    # total_rows, e.g. counted by the schema pass, turns the progress line into a percentage; with a checkpoint the
+    # load starts after the rows it has already committed
+    def run(self, table_name, csv_file_path, column_types, total_rows=None):
+        parsed_queue = queue.Queue(maxsize=self.queue_size)  # reader -> coercion
+        coerced_queue = queue.Queue(maxsize=self.queue_size)  # coercion -> writer
+        stats = {"inserted": 0, "failed": [], "start_time": time.perf_counter(), "total_rows": total_rows}
+        threads = []
+        try:
+            start_row, start_byte = ((self.checkpoint.row_offset, self.checkpoint.byte_offset) if self.checkpoint
+                                     else (0, None))
+            with read_blocks_from(csv_file_path, self.batch_size, start_row, start_byte) as (header, _, blocks):
+                # placeholders for row data in the driver's parameter style
+                insert_query = self.db_connection.backend.insert_query(table_name, len(header))
+                if is_columnar(csv_file_path):
+                    coercers = []  # values arrive typed
+                else:
+                    coercers = [get_coercer(column_type) for column_type in column_types]
+                threads = [
+                    threading.Thread(target=self.coerce_stage, args=(coercers, parsed_queue, coerced_queue),
+                                     daemon=True),
+                    threading.Thread(target=self.write_stage, args=(insert_query, coerced_queue, stats), daemon=True)
+                ]
+                for thread in threads:
+                    thread.start()
+
+                # reader stage runs on the calling thread
+                batch_start_idx = start_row + 1
+                for batch, offset in blocks:  # batch_size rows at a time, decompressed or decoded as they are read
+                    if not self.put(parsed_queue, (batch_start_idx, batch, offset)):
+                        break
+                    batch_start_idx += len(batch)
+                self.put(parsed_queue, _END)
+        except BaseException:
+            self.stop_event.set()  # stop the worker stages before surfacing the reader error
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            if threads and not self.progress:
+                print()  # end the progress line
+
+        if self.errors:
+            raise self.errors[0]
+        if self.checkpoint:
+            self.checkpoint.finish()
+        return stats["inserted"], stats["failed"], time.perf_counter() - stats["start_time"]
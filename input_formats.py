@@ -0,0 +1,153 @@
+# readers for uploaded files: csv, memory-mapped when plain and decompressed while it streams when compressed, and
+# parquet or arrow ipc read a record batch at a time; pyarrow and zstandard are optional and only needed for their
+# formats
+
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import os
+from contextlib import closing, contextmanager
+from itertools import islice
+from csv_scanner import CSVScanner
+
+COMPRESSED_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}  # standard library codecs
+ZSTD_SUFFIXES = (".zst", ".zstd")
+PARQUET_SUFFIXES = (".parquet", ".pq")
+ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+CSV_SUFFIXES = tuple(".csv" + codec for codec in ("", *COMPRESSED_OPENERS, *ZSTD_SUFFIXES))
+UPLOAD_SUFFIXES = CSV_SUFFIXES + PARQUET_SUFFIXES + ARROW_SUFFIXES  # files a partition directory is scanned for
+
+
+# lowercase extension of a file
+def suffix(path):
+    return os.path.splitext(path)[1].lower()
+
+
+# whether a file holds typed columns with an embedded schema rather than csv text
+def is_columnar(path):
+    return suffix(path) in PARQUET_SUFFIXES + ARROW_SUFFIXES
+
+
+# whether a file is csv the server can read directly, as LOAD DATA needs
+def is_plain_csv(path):
+    return not is_columnar(path) and suffix(path) not in (*COMPRESSED_OPENERS, *ZSTD_SUFFIXES)
+
+
+# open a csv file as text, a compressed file is decompressed as it is read, never to disk
+def open_text(path):
+    extension = suffix(path)
+    if extension in COMPRESSED_OPENERS:
+        return COMPRESSED_OPENERS[extension](path, "rt", newline="")
+    if extension in ZSTD_SUFFIXES:
+        import zstandard  # optional dependency, only needed for zstd files
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(reader, newline="")
+    return open(path, "r", newline="")
+
+
+# arrow schema and record batches of a parquet or arrow file with at most batch_size rows each, read one row
+# group or stored batch at a time
+@contextmanager
+def open_record_batches(path, batch_size):
+    import pyarrow  # optional dependency, only needed for parquet and arrow files
+    import pyarrow.ipc
+    import pyarrow.parquet
+    if suffix(path) in PARQUET_SUFFIXES:
+        with closing(pyarrow.parquet.ParquetFile(path)) as parquet_file:
+            yield parquet_file.schema_arrow, parquet_file.iter_batches(batch_size=batch_size)
+        return
+    with pyarrow.memory_map(path) as source:  # pages are read on demand, not copied up front
+        try:
+            reader = pyarrow.ipc.open_file(source)  # random access format, as feather v2 writes
+            batches = (reader.get_batch(idx) for idx in range(reader.num_record_batches))
+        except pyarrow.ArrowInvalid:
+            source.seek(0)
+            reader = pyarrow.ipc.open_stream(source)  # streaming format
+            batches = iter(reader)
+        yield reader.schema, (batch.slice(offset, batch_size) for batch in batches
+                              for offset in range(0, batch.num_rows, batch_size))
+
+
+# rows of a record batch as tuples of python values, or of strings shaped like csv cells when as_text is set
+def batch_rows(batch, as_text):
+    import pyarrow
+    import pyarrow.compute
+    columns = []
+    for column in batch.columns:
+        if as_text:
+            if pyarrow.types.is_boolean(column.type):
+                column = pyarrow.compute.if_else(column, "true", "false")
+            column = pyarrow.compute.fill_null(pyarrow.compute.cast(column, pyarrow.string()), "")
+        columns.append(column.to_pylist())
+    return list(zip(*columns))
+
+
+# header, column types declared by the file (None for csv) and an iterator over blocks of at most block_size rows;
+# csv cells are strings, parquet and arrow values keep their types unless as_text is set
+@contextmanager
+def read_blocks(path, block_size, as_text=False):
+    with read_blocks_from(path, block_size, as_text=as_text) as (header, declared_types, blocks):
+        yield header, declared_types, (rows for rows, _ in blocks)
+
+
+# read_blocks with the blocks as (rows, byte offset after them) starting after start_row data rows; a plain csv
+# seeks straight to start_byte when it is given and has offsets to resume from, other formats read past the
+# skipped rows and have None as offset
+@contextmanager
+def read_blocks_from(path, block_size, start_row=0, start_byte=None, as_text=False):
+    if is_columnar(path):
+        with open_record_batches(path, block_size) as (schema, batches):
+            yield (list(schema.names), [arrow_column_type(field.type) for field in schema],
+                   skip_rows(((batch_rows(batch, as_text), None) for batch in batches), start_row))
+        return
+    if is_plain_csv(path):
+        with CSVScanner(path) as scanner:  # blocks are cut at row boundaries found in the mapped file
+            header = scanner.header()
+            if header is None:
+                raise ValueError(f"'{path}' is empty, expected a header row")
+            blocks = scanner.blocks(block_size, start_byte)
+            yield header, None, blocks if start_byte is not None else skip_rows(blocks, start_row)
+        return
+    with open_text(path) as file:
+        csv_reader = csv.reader(file)
+        header = next(csv_reader, None)  # read the header row
+        if header is None:
+            raise ValueError(f"'{path}' is empty, expected a header row")
+        next(islice(csv_reader, start_row, start_row), None)  # parse past the skipped rows without keeping them
+        yield header, None, ((rows, None) for rows in iter(lambda: list(islice(csv_reader, block_size)), []))
+
+
+# (rows, offset) blocks without their first count rows, the block the count ends in is cut
+def skip_rows(blocks, count):
+    for rows, offset in blocks:
+        if count >= len(rows):
+            count -= len(rows)
+            continue
+        yield (rows[count:] if count else rows), offset
+        count = 0
+
+
+# MySQL column type for an arrow type, None where the values decide (text is sized from the longest value)
+def arrow_column_type(arrow_type):
+    import pyarrow
+    types = pyarrow.types
+    if types.is_boolean(arrow_type):
+        return "BOOLEAN"
+    if types.is_integer(arrow_type):
+        if arrow_type.bit_width < 32 or (types.is_signed_integer(arrow_type) and arrow_type.bit_width == 32):
+            return "INT"
+        if arrow_type.bit_width == 64 and types.is_unsigned_integer(arrow_type):
+            return "DECIMAL(20, 0)"  # past the BIGINT range
+        return "BIGINT"
+    if types.is_floating(arrow_type):
+        return "DOUBLE"
+    if types.is_decimal(arrow_type):
+        return f"DECIMAL({arrow_type.precision}, {arrow_type.scale})"
+    if types.is_date(arrow_type):
+        return "DATE"
+    if types.is_timestamp(arrow_type):
+        return "DATETIME"
+    return None
+
@@ -0,0 +1,89 @@
+# per-table lexical index: column-name tokens and low-cardinality values mapped to query tokens
+
+import string
+
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation.replace("-", "").replace("_", ""))  # keep - and _
+
+# words too generic to stand for a column or a value on their own
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "how", "id", "in", "is", "it",
+    "me", "no", "not", "of", "on", "or", "per", "show", "than", "that", "the", "to", "was", "what", "which", "who",
+    "with", "yes"
+}
+
+
+# normalize text the same way questions are normalized before phrase matching
+def normalize_phrase(text):
+    return " ".join(text.lower().translate(PUNCTUATION_TABLE).split())
+
+
+# crude suffix stripping so plural and verb forms share a base word
+def stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "xes", "zes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    return word
+
+
+# the word, its stem and the stem's plural
+def word_variants(word):
+    base = stem(word)
+    if base.endswith("y") and len(base) > 1 and base[-2] not in "aeiou":
+        plural = base[:-1] + "ies"
+    elif base.endswith(("s", "x", "z", "ch", "sh")):
+        plural = base + "es"
+    else:
+        plural = base + "s"
+    return {word, base, plural}
+
+
+# quote a value as a sql string literal
+def quote_value(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+# build the phrase -> tokens index of a table from its columns and the distinct values of its text columns
+def build_lexicon(columns, distinct_values):
+    phrases = {}
+
+    # multi-word column names can be typed with spaces, single words resolve when only one column uses them
+    word_columns = {}
+    column_names = {column_name.lower() for column_name, _ in columns}
+    for column_name, _ in columns:
+        words = [word for word in column_name.lower().split("_") if word]
+        if len(words) > 1:
+            phrases[" ".join(words)] = [column_name]
+        for word in words:
+            if len(word) < 3 or word.isdigit() or word in STOP_WORDS:
+                continue
+            for variant in word_variants(word):
+                word_columns.setdefault(variant, set()).add(column_name)
+    for word, matching_columns in word_columns.items():
+        if len(matching_columns) == 1 and word not in phrases and word not in column_names:
+            phrases[word] = [next(iter(matching_columns))]
+
+    # values of low-cardinality text columns become column = value conditions
+    value_columns = {}
+    stored_values = {}  # column -> normalized value -> value as stored, to restore the case of typed values
+    for (column_name, column_type), values in zip(columns, distinct_values):
+        if values is None or not column_type.upper().startswith("VARCHAR"):
+            continue
+        for value in values:
+            phrase = normalize_phrase(value)
+            stored_values.setdefault(column_name, {})[phrase] = value
+            if len(phrase) < 3 or phrase in STOP_WORDS or phrase.replace("-", "").isdigit() or phrase in column_names:
+                continue  # short codes and numbers are too likely to appear in a question by accident
+            value_columns.setdefault(phrase, []).append((column_name, value))
+    for phrase, matches in value_columns.items():
+        if len(matches) == 1 and phrase not in phrases:  # a value shared by two columns is ambiguous
+            column_name, value = matches[0]
+            phrases[phrase] = [column_name, "equals", quote_value(value)]
+
+    return {"phrases": phrases, "values": stored_values}
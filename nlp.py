@@ -1,12 +1,192 @@
 # nlp capabilities for user inquiries
 
 import re
-import string
+from artifact_store import ArtifactStore
+from approximate import estimator_columns
+from tracing import tracer
+from lexicon import PUNCTUATION_TABLE
+from schema_catalog import SchemaCatalog
+
+# synonym mappings to replace common phrases with column names or sql terms
+SYNONYM_MAP = {
+    # nba specific synonyms
+    "players": "player_name", "how tall": "player_height", "how heavy": "player_weight",
+    "performance": "ppg apg net_rating", "statistics": "ppg apg rpg net_rating oreb_percent dreb_percent",
+    "points": "ppg", "rebounds": "rpg", "assists": "apg", "scoring": "ppg", "season": "season",
+    "draft year": "draft_year", "drafted in": "draft_year",
+    # netflix specific synonyms
+    "shows": "title", "movies": "type", "genres": "listed_in", "ratings": "rating",
+    # supermarket specific synonyms
+    "sales": "total", "products": "product_line", "cost": "cogs", "profit": "gross_income",
+    "customer type": "customer_type", "payment method": "payment",
+    # general synonyms
+    "best": "MAX", "worst": "MIN", "average": "AVG", "total": "SUM", "sum": "SUM", "greater than": ">",
+    "greater than or equal to": ">=", "less than": "<", "less than or equal to": "<=", "at least": ">=",
+    "no less than": ">=", "at most": "<=", "no more than": "<="
+}
+
+SEASON_PATTERN = re.compile(r"(\d{4})(\d{2})")  # 201920 -> 2019-20
+
+_MATCH = object()  # trie key holding the replacement of a complete phrase
+
+
+# word-level trie that replaces phrases in one left-to-right pass, preferring the longest phrase at each word
+class PhraseMatcher:
+
+    def __init__(self, phrase_map=None):
+        self.root = {}
+        for phrase, replacement in (phrase_map or {}).items():
+            self.add(phrase, replacement)
+
+    # register a phrase and the tokens (a string or a token list) it is replaced with
+    def add(self, phrase, replacement):
+        node = self.root
+        for word in phrase.split():
+            node = node.setdefault(word, {})
+        node[_MATCH] = replacement.split() if isinstance(replacement, str) else list(replacement)
+
+    # replace matched phrases in a list of words, cost grows with the input rather than the dictionary size
+    def replace(self, words):
+        tokens = []
+        i = 0
+        while i < len(words):
+            node = self.root
+            match = None
+            match_end = i
+            j = i
+            while j < len(words) and words[j] in node:  # walk the trie as far as the words allow
+                node = node[words[j]]
+                j += 1
+                if _MATCH in node:
+                    match = node[_MATCH]
+                    match_end = j
+            if match is None:
+                tokens.append(words[i])
+                i += 1
+            else:
+                tokens.extend(match)
+                i = match_end
+        return tokens
+
+
+SYNONYM_MATCHER = PhraseMatcher(SYNONYM_MAP)  # compiled once for every question
+
+# aggregation words and the sql function they select
+AGGREGATION_MAP = {
+    "average": "AVG", "avg": "AVG", "AVG": "AVG",
+    "maximum": "MAX", "max": "MAX", "MAX": "MAX",
+    "minimum": "MIN", "min": "MIN", "MIN": "MIN",
+    "sum": "SUM", "SUM": "SUM", "total": "SUM", "TOTAL": "SUM",
+    "count": "COUNT"
+}
+
+CONDITION_OPERATORS = {"greater": ">", "less": "<", "equals": "=", ">": ">", "<": "<", ">=": ">=",
+                       "<=": "<="}  # column-operator-value
+EQUALITY_WORDS = {"is", "equals"}  # categorical column = value
+COMPARISON_WORDS = {"fewer": "<", "more": ">"}  # column fewer/more than value
+SEASON_FORMAT = re.compile(r"^\d{4}-\d{2}$")  # 2019-20
+
+
+# table-driven matcher that turns tokens into query components in one left-to-right pass
+class TokenMatcher:
+
+    def __init__(self, column_mapping, stored_values=None):
+        self.quantitative = set(column_mapping["quantitative"])  # set lookups instead of list scans
+        self.categorical = set(column_mapping["categorical"])
+        self.stored_values = stored_values or {}  # column -> lowercased value -> value as stored, from the lexicon
+
+    # condition phrases starting at token i, returns the index of the last token consumed
+    def match_conditions(self, tokens, i, conditions):
+        count = len(tokens)
+
+        # draft year / season references
+        if tokens[i] == "draft_year" and i + 1 < count and tokens[i + 1].isdigit() and len(tokens[i + 1]) == 4:
+            conditions.append(f"draft_year = '{tokens[i + 1]}'")
+            i += 1  # the year has been consumed
+        elif tokens[i] == "season" and i > 0 and SEASON_FORMAT.match(tokens[i - 1]):
+            conditions.append(f"season = '{tokens[i - 1]}'")
+
+        # quantitative column followed by an operator phrase
+        if tokens[i] in self.quantitative:
+            column = tokens[i]
+            if i + 2 < count and tokens[i + 1] in CONDITION_OPERATORS:  # column > value
+                conditions.append(f"{column} {CONDITION_OPERATORS[tokens[i + 1]]} {tokens[i + 2]}")
+                i += 2
+            elif i + 3 < count and tokens[i + 1] in COMPARISON_WORDS and tokens[i + 2] == "than":  # fewer/more than
+                conditions.append(f"{column} {COMPARISON_WORDS[tokens[i + 1]]} {tokens[i + 3]}")
+                i += 3
+            elif i + 4 < count and tokens[i + 1] == "between" and tokens[i + 3] == "and":  # between x and y
+                conditions.append(f"{column} BETWEEN {tokens[i + 2]} AND {tokens[i + 4]}")
+                i += 4
+
+        # categorical column = value, including those produced by the table lexicon
+        if i + 2 < count and tokens[i] in self.categorical and tokens[i + 1] in EQUALITY_WORDS:
+            value = tokens[i + 2]
+            if value not in self.categorical and value not in self.quantitative:  # a column name is not a value
+                if not value.startswith("'"):  # typed, and lowercased, by the user
+                    value = self.stored_values.get(tokens[i], {}).get(value, value)
+                    value = "'" + value.replace("'", "''") + "'"
+                conditions.append(f"{tokens[i]} = {value}")
+                i += 2
+        return i
+
+    # match preprocessed tokens to sql query components
+    def match(self, tokens):
+        columns = []  # selected columns, in order of first mention
+        selected = set()
+        conditions = []
+        order_by = None
+        limit = None
+        aggregation = None
+        count = len(tokens)
+
+        i = 0
+        while i < count:  # every token is visited once, lookahead is bounded
+            token = tokens[i]
+            aggregation = AGGREGATION_MAP.get(token, aggregation)
+            if (token in self.quantitative or token in self.categorical) and token not in selected:
+                columns.append(token)
+                selected.add(token)
+
+            i = self.match_conditions(tokens, i, conditions)
+
+            # sorting and limit phrases at the token reached after any condition
+            if i + 1 < count:
+                if tokens[i] == "highest":
+                    order_by = f"{tokens[i + 1]} DESC"
+                elif tokens[i] == "lowest":
+                    order_by = f"{tokens[i + 1]} ASC"
+                elif tokens[i] == "top" and tokens[i + 1].isdigit():
+                    limit = int(tokens[i + 1])
+            i += 1
+
+        # return all components of the sql query, grouping by the selected columns when aggregating
+        return {
+            "action": "SELECT",
+            "columns": columns,
+            "conditions": " AND ".join(conditions),
+            "group_by": columns if aggregation else [],
+            "limit": limit,
+            "order_by": order_by,
+            "aggregation": aggregation
+        }
+
+
+# words the query handlers react to, table lexicons never override them
+QUERY_KEYWORDS = {
+    "is", "equals", "greater", "less", "between", "and", "fewer", "more", "than", "top", "highest", "lowest",
+    "count", "max", "min", "avg", "maximum", "minimum"
+}
 
 
 class NLPProcessor:
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, schema_catalog=None):
         self.db_connection = db_connection  # initialize with db connection
+        self.schema_catalog = schema_catalog or SchemaCatalog(db_connection)  # cached column metadata
+        self.schema_catalog.add_listener(self.forget_table)  # drop per-table state on upload/remove
+        self.artifact_store = ArtifactStore(db_connection.database)  # per-table lexicons built at upload time
+        self.synonym_matchers = {}  # table name -> synonyms merged with the table lexicon, loaded lazily
+        self.token_matchers = {}  # table name -> compiled token matcher
 
         # dictionary to convert number words to digits
         self.number_words_to_digits = {
@@ -17,193 +197,66 @@ class NLPProcessor:
             "eighteen": "18", "nineteen": "19", "twenty": "20"
         }
 
-    # preprocess user input by normalizing and handling synonyms
-    def preprocess_input(self, user_input):
-        # synonym mappings to replace common phrases with column names or sql terms
-        synonym_map = {
-            # nba specific synonyms
-            "players": "player_name", "how tall": "player_height", "how heavy": "player_weight",
-            "performance": "ppg apg net_rating", "statistics": "ppg apg rpg net_rating oreb_percent dreb_percent",
-            "points": "ppg", "rebounds": "rpg", "assists": "apg", "scoring": "ppg", "season": "season",
-            "draft year": "draft_year", "drafted in": "draft_year",
-            # netflix specific synonyms
-            "shows": "title", "movies": "type", "genres": "listed_in", "ratings": "rating",
-            # supermarket specific synonyms
-            "sales": "total", "products": "product_line", "cost": "cogs", "profit": "gross_income",
-            "customer type": "customer_type", "payment method": "payment",
-            # general synonyms
-            "best": "MAX", "worst": "MIN", "average": "AVG", "total": "SUM", "sum": "SUM", "greater than": ">",
-            "greater than or equal to": ">=", "less than": "<", "less than or equal to": "<="
-        }
+    # forget cached per-table state, or all of it when no table is given
+    def forget_table(self, table_name=None):
+        if table_name is None:
+            self.synonym_matchers = {}
+            self.token_matchers = {}
+        else:
+            self.synonym_matchers.pop(table_name.lower(), None)
+            self.token_matchers.pop(table_name.lower(), None)
+
+    # synonym matcher for a table: the shared synonyms plus the table's lexical index, built on first use
+    def get_synonym_matcher(self, table_name):
+        key = table_name.lower()
+        matcher = self.synonym_matchers.get(key)
+        if matcher is None:
+            lexicon = self.artifact_store.load("lexicon", table_name)
+            if lexicon is None:  # table uploaded before lexicons existed, or outside chatdb
+                matcher = SYNONYM_MATCHER
+            else:
+                matcher = PhraseMatcher(SYNONYM_MAP)
+                for phrase, tokens in lexicon["phrases"].items():
+                    if (phrase not in SYNONYM_MAP and phrase not in QUERY_KEYWORDS
+                            and phrase not in self.number_words_to_digits):
+                        matcher.add(phrase, tokens)
+            self.synonym_matchers[key] = matcher
+        return matcher
 
+    # preprocess user input by normalizing and handling synonyms
+    def preprocess_input(self, user_input, table_name=None):
         # normalize input by converting to lowercase, removing punctuation, and replacing synonyms
         user_input = user_input.lower()
-        user_input = user_input.translate(str.maketrans("", "", string.punctuation.replace("-", "").replace("_", "")))
-        user_input = re.sub(r"(\d{4})(\d{2})", r"\1-\2", user_input)
+        user_input = user_input.translate(PUNCTUATION_TABLE)
+        user_input = SEASON_PATTERN.sub(r"\1-\2", user_input)
 
-        # replace synonyms with mapped terms
-        for phrase, replacement in synonym_map.items():
-            user_input = user_input.replace(phrase, replacement)
+        # replace synonyms with mapped terms in a single longest-match pass
+        matcher = self.get_synonym_matcher(table_name) if table_name else SYNONYM_MATCHER
+        tokens = matcher.replace(user_input.split())
 
-        # split the input into tokens and convert number words to digits
-        tokens = user_input.split()
+        # convert number words to digits
         tokens = [self.number_words_to_digits.get(token, token) for token in tokens]
 
         return tokens  # return preprocessed tokens
 
-    # fetch column mappings from the database for a given table
+    # fetch column mappings for a given table from the shared schema catalog
     def fetch_column_mapping(self, table_name):
-        cursor = self.db_connection.get_cursor()
-        cursor.execute(f"SHOW COLUMNS FROM {table_name};")
-        columns = cursor.fetchall()
-        cursor.close()
-
-        quantitative_columns = []  # initialize list for quantitative columns
-        categorical_columns = []  # initialize list for categorical columns
-
-        # iterate over columns and classify them by data type
-        for column in columns:
-            column_name = column[0]
-            data_type = column[1]
-            base_type = data_type.split('(')[0]  # get the base type
-            if base_type in ["int", "decimal", "double", "bigint"]:
-                quantitative_columns.append(column_name)  # add to quantitative list if numeric
-            elif base_type in ["varchar", "mediumtext", "char", "date", "time"]:
-                categorical_columns.append(column_name)  # add to categorical list if text/date
-
-        return {"quantitative": quantitative_columns,
-                "categorical": categorical_columns}  # return column classification
-
-    # handle special conditions like draft year and season
-    @staticmethod
-    def handle_special_conditions(tokens, i, conditions):
-        # handle draft year references and ensure valid year format
-        if tokens[i] == "draft_year" and i + 1 < len(tokens):
-            draft_year = tokens[i + 1]
-            if draft_year.isdigit() and len(draft_year) == 4:  # check if year is valid
-                conditions.append(f"draft_year = '{draft_year}'")  # add to conditions
-                return i + 1  # skip the next token (the year)
-
-        # handle season references and ensure valid season format
-        if tokens[i] == "season" and i > 0:
-            season = tokens[i - 1]
-            if re.match(r"^\d{4}-\d{2}$", season):  # match season format
-                conditions.append(f"season = '{season}'")  # add to conditions
-                return i  # return the current index
-
-        return i  # return unchanged index if no special condition matched
-
-    # handle column-value conditions
-    @staticmethod
-    def handle_column_value_conditions(tokens, i, column_mapping, conditions):
-        # handle conditions like column = value, column > value
-        if i + 2 < len(tokens) and tokens[i + 1] in {"is", "equals", "greater", "less", ">", "<", "between"}:
-            column = tokens[i]
-            operator = tokens[i + 1]
-            value = tokens[i + 2]
-
-            condition_map = {  # map operator words to sql operators
-                "greater": ">", "greater than": ">", "less": "<", "less than": "<",
-                "equals": "=", "equal to": "=",
-                ">": ">", "<": "<"
-            }
-            sql_operator = condition_map.get(operator)
-            if sql_operator and column in column_mapping["quantitative"]:  # check if valid column
-                conditions.append(f"{column} {sql_operator} {value}")  # add condition to list
-                return i + 2  # skip the current token, operator, and value
-
-        # handle conditions with "fewer than" or "more than"
-        if tokens[i] in column_mapping["quantitative"] and i + 3 < len(tokens):
-            column = tokens[i]
-            if tokens[i + 1] in {"fewer", "more"} and tokens[i + 2] == "than":
-                value = tokens[i + 3]
-                if tokens[i + 1] == "fewer":
-                    conditions.append(f"{column} < {value}")
-                elif tokens[i + 1] == "more":
-                    conditions.append(f"{column} > {value}")
-                return i + 3
-
-        # handle "between" conditions
-        if tokens[i] in column_mapping["quantitative"] and i + 4 < len(tokens):
-            column = tokens[i]
-            if tokens[i + 1] == "between" and tokens[i + 3] == "and":
-                value1 = tokens[i + 2]
-                value2 = tokens[i + 4]
-                conditions.append(f"{column} BETWEEN {value1} AND {value2}")
-                return i + 4  # skip the "between" and "and" parts
-
-        return i  # return unchanged index if no condition matched
-
-    # handle aggregation functions
-    @staticmethod
-    def handle_aggregation(token, aggregation):
-        aggregation_map = {
-            "average": "AVG", "avg": "AVG", "AVG": "AVG",
-            "maximum": "MAX", "max": "MAX", "MAX": "MAX",
-            "minimum": "MIN", "min": "MIN", "MIN": "MIN",
-            "sum": "SUM", "SUM": "SUM", "total": "SUM", "TOTAL": "SUM",
-            "count": "COUNT"
-        }
-        return aggregation_map.get(token, aggregation)  # return the mapped aggregation function
-
-    # handle sorting tokens
-    @staticmethod
-    def handle_sorting(tokens, i, order_by):
-        if tokens[i] == "highest" and i + 1 < len(tokens):
-            return f"{tokens[i + 1]} DESC"  # descending order
-        elif tokens[i] == "lowest" and i + 1 < len(tokens):
-            return f"{tokens[i + 1]} ASC"  # ascending order
-        return order_by  # return unchanged order if no sorting matched
-
-    # handle limit tokens
-    @staticmethod
-    def handle_limit(tokens, i, limit):
-        if tokens[i] == "top" and i + 1 < len(tokens) and tokens[i + 1].isdigit():
-            return int(tokens[i + 1])  # return limit as integer
-        return limit  # return unchanged limit if no "top" condition matched
+        return self.schema_catalog.classify_columns(table_name)  # return column classification
+
+    # compiled token matcher for a table, built once from its column classification
+    def get_token_matcher(self, table_name):
+        key = table_name.lower()
+        matcher = self.token_matchers.get(key)
+        if matcher is None:
+            lexicon = self.artifact_store.load("lexicon", table_name) or {}
+            matcher = TokenMatcher(self.fetch_column_mapping(table_name), lexicon.get("values"))
+            self.token_matchers[key] = matcher
+        return matcher
 
     # match preprocessed tokens to sql query components
-    def match_tokens_to_sql(self, tokens, column_mapping):
-        action = "SELECT"  # default action is select
-        columns = []  # initialize list for selected columns
-        conditions = []  # initialize list for conditions
-        group_by = []  # initialize list for group by
-        order_by = None  # initialize order by
-        limit = None  # initialize limit
-        aggregation = None  # initialize aggregation function
-
-        i = 0
-        while i < len(tokens):  # iterate over all tokens
-            token = tokens[i]
-            aggregation = self.handle_aggregation(token, aggregation)  # handle aggregation
-
-            # add the token to the columns if it's a valid column name
-            if token in column_mapping["quantitative"] or token in column_mapping["categorical"]:
-                if token not in columns:
-                    columns.append(token)
-
-            i = self.handle_special_conditions(tokens, i, conditions)  # handle special conditions
-            i = self.handle_column_value_conditions(tokens, i, column_mapping,
-                                                    conditions)  # handle column-value conditions
-            order_by = self.handle_sorting(tokens, i, order_by)  # handle sorting
-            limit = self.handle_limit(tokens, i, limit)  # handle limit
-
-            i += 1  # move to next token
-
-        # ensure group by is set if aggregation exists
-        if aggregation and not group_by:
-            group_by = columns
-
-        # return all components of the sql query
-        return {
-            "action": action,
-            "columns": columns,
-            "conditions": " AND ".join(conditions),
-            "group_by": group_by,
-            "limit": limit,
-            "order_by": order_by,
-            "aggregation": aggregation
-        }
+    @staticmethod
+    def match_tokens_to_sql(tokens, column_mapping):
+        return TokenMatcher(column_mapping).match(tokens)
 
     # generate the final sql query based on components
     @staticmethod
@@ -233,19 +286,42 @@ class NLPProcessor:
             }
 
         # process the user input to generate a sql query
-        tokens = self.preprocess_input(user_input)
-        column_mapping = self.fetch_column_mapping(table_name)
-        components = self.match_tokens_to_sql(tokens, column_mapping)
+        with tracer.span("nlp.preprocess"):
+            tokens = self.preprocess_input(user_input, table_name)
+        with tracer.span("metadata"):  # column mapping from the schema catalog
+            token_matcher = self.get_token_matcher(table_name)
+        with tracer.span("nlp.match"):
+            components = token_matcher.match(tokens)
 
         if not components["columns"] and not components["aggregation"]:
             return {"error": "Could not identify columns or aggregation in your query."}
 
         try:
-            sql_query = self.generate_query(components, table_name)
+            with tracer.span("nlp.generate"):
+                sql_query = self.generate_query(components, table_name)
             return {
                 "description": f"query {', '.join(components['columns'])} with these filters: "
                                f"{components['conditions']}",
-                "sql_query": sql_query
+                "sql_query": sql_query,
+                "components": components  # kept so the question can also be answered from a sample
             }
         except Exception as e:
             return {"error": str(e)}  # handle errors during query generation
+
+    # sql answering an intent from the table's sample plus a note on the estimate, or None and the reason the
+    # question has to run exactly
+    def approximate_intent(self, intent_data, table_name):
+        components = intent_data.get("components")
+        if not components or not components["aggregation"]:
+            return None, "Approximate mode only applies to aggregate questions, running it exactly."
+        sample = self.artifact_store.load("sample", table_name)
+        if sample is None:
+            return None, f"Table '{table_name}' is small enough to have no sample table, running it exactly."
+        columns = estimator_columns(components["aggregation"], components["columns"][0], sample["fraction"])
+        if columns is None:
+            return None, f"{components['aggregation']} cannot be estimated from a sample, running it exactly."
+        sample_components = dict(components, aggregation=None, columns=columns)
+        note = (f"Estimated from a {sample['fraction']:.2%} sample ({sample['sample_rows']:,} of "
+                f"{sample['row_count']:,} rows). margin_95 is the half-width of a 95% confidence interval; "
+                f"groups missing from the sample are not shown.")
+        return self.generate_query(sample_components, sample["table"]), note
@@ -0,0 +1,133 @@
+# two-level cache for user questions: question -> generated sql, and sql -> result rows
+
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from db_config import cache_config
+from lexicon import normalize_phrase
+
+TABLE_REFERENCE = re.compile(r"\b(?:FROM|JOIN)\s+[`\"]?(\w+)[`\"]?", re.IGNORECASE)  # tables a query reads
+VOLATILE_FUNCTIONS = re.compile(r"\b(?:RAND|NOW|UUID|SYSDATE|CURDATE|CURTIME|CURRENT_\w+)\b", re.IGNORECASE)
+
+
+# rough in-memory size of a result set, used against the cache budget
+def estimate_result_size(column_names, rows):
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(name) for name in column_names)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class QueryCache:
+
+    def __init__(self, max_intents=None, max_result_bytes=None, result_ttl_seconds=None):
+        self.max_intents = max_intents or cache_config["intent_cache_size"]
+        self.max_result_bytes = max_result_bytes or cache_config["result_cache_bytes"]
+        self.result_ttl_seconds = result_ttl_seconds or cache_config["result_ttl_seconds"]
+        self.intents = OrderedDict()  # (table, normalized question) -> intent, least recently used first
+        # sql -> (column names, rows, size, stored at, tables read), least recently used first
+        self.results = OrderedDict()
+        self.result_bytes = 0  # estimated size of all cached results
+        self.table_keys = {}  # table -> cached intent and result keys that depend on it
+        self.counters = {"intent_hits": 0, "intent_misses": 0, "result_hits": 0, "result_misses": 0}
+        self.lock = threading.Lock()
+
+    # normalized form of a question so spacing, case and punctuation do not split cache entries; raw sql runs as
+    # typed, where case and punctuation matter, so it is only stripped
+    @staticmethod
+    def normalize_question(question):
+        if question.strip().lower().startswith("select"):  # the check extract_intent uses for raw sql
+            return question.strip()
+        return normalize_phrase(question)
+
+    # remember which table a cached entry depends on
+    def track(self, table_name, key):
+        self.table_keys.setdefault(table_name.lower(), set()).add(key)
+
+    # cached intent for a question on a table, None on a miss
+    def get_intent(self, table_name, question):
+        key = ("intent", table_name.lower(), self.normalize_question(question))
+        with self.lock:
+            intent = self.intents.get(key)
+            if intent is None:
+                self.counters["intent_misses"] += 1
+                return None
+            self.intents.move_to_end(key)
+            self.counters["intent_hits"] += 1
+            return intent
+
+    # cache the intent generated for a question
+    def put_intent(self, table_name, question, intent):
+        key = ("intent", table_name.lower(), self.normalize_question(question))
+        with self.lock:
+            self.intents[key] = intent
+            self.intents.move_to_end(key)
+            self.track(table_name, key)
+            while len(self.intents) > self.max_intents:
+                evicted_key, _ = self.intents.popitem(last=False)  # evict the least recently used question
+                self.table_keys.get(evicted_key[1], set()).discard(evicted_key)
+
+    # cached (column names, rows) for a query, None on a miss or once the entry is older than the ttl
+    def get_result(self, sql_query):
+        key = ("result", sql_query)
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is not None and time.monotonic() - entry[3] > self.result_ttl_seconds:
+                self.drop_result(key)
+                entry = None
+            if entry is None:
+                self.counters["result_misses"] += 1
+                return None
+            self.results.move_to_end(key)
+            self.counters["result_hits"] += 1
+            return entry[0], entry[1]
+
+    # cache the rows of a deterministic query if they fit the memory budget
+    def put_result(self, sql_query, table_name, column_names, rows):
+        if VOLATILE_FUNCTIONS.search(sql_query):
+            return  # results would differ on the next run
+        size = estimate_result_size(column_names, rows)
+        if size > self.max_result_bytes:
+            return
+        key = ("result", sql_query)
+        tables = {table_name.lower()} | {name.lower() for name in TABLE_REFERENCE.findall(sql_query)}
+        with self.lock:
+            if key in self.results:
+                self.drop_result(key)
+            self.results[key] = (column_names, rows, size, time.monotonic(), tables)
+            self.result_bytes += size
+            for name in tables:
+                self.track(name, key)
+            while self.result_bytes > self.max_result_bytes:
+                self.drop_result(next(iter(self.results)))  # evict the least recently used result
+
+    # remove one cached result and account for its size
+    def drop_result(self, key):
+        entry = self.results.pop(key, None)
+        if entry is not None:
+            self.result_bytes -= entry[2]
+            for name in entry[4]:
+                self.table_keys.get(name, set()).discard(key)
+
+    # drop every entry that depends on a table, or everything when no table is given
+    def invalidate(self, table_name=None):
+        with self.lock:
+            if table_name is None:
+                self.intents.clear()
+                self.results.clear()
+                self.result_bytes = 0
+                self.table_keys = {}
+                return
+            for key in self.table_keys.pop(table_name.lower(), set()):
+                if key[0] == "intent":
+                    self.intents.pop(key, None)
+                else:
+                    self.drop_result(key)
+
+    # hit and miss counters plus current cache sizes
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, intents=len(self.intents), results=len(self.results),
+                        result_bytes=self.result_bytes)
@@ -0,0 +1,104 @@
+# runs statements of a question on a worker thread so the session stays responsive: a spinner while the engine
+# works, a statement timeout, and cancellation with ctrl-c
+
+import sys
+import threading
+import time
+from db_config import query_config
+
+SPINNER_FRAMES = "|/-\\"
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class QueryRunner:
+
+    def __init__(self, db_connection):
+        self.db_connection = db_connection
+        self.timeout_seconds = query_config["timeout_seconds"]
+        self.poll_seconds = query_config["poll_seconds"]
+        self.spinner_after_seconds = query_config["spinner_after_seconds"]
+
+    # execute a query on a cursor, the timeout covers the execute phase and each fetch separately; no engine-side cap
+    # (MAX_EXECUTION_TIME) is set, it would outlive the statement on the pooled session and cut off an unbuffered
+    # result while its pages are still being read
+    def execute(self, conn, cursor, sql_query):
+        return self.run(conn, cursor, lambda: cursor.execute(sql_query))
+
+    # next rows of an executed query, an unbuffered result can still be computing on the server
+    def fetch(self, conn, cursor, size):
+        return self.run(conn, cursor, lambda: cursor.fetchmany(size))
+
+    # run a call on a worker thread and wait for it; on timeout or ctrl-c the engine is told to stop and the
+    # connection is handed to the worker, which discards it once the call returns
+    def run(self, conn, cursor, call):
+        backend = self.db_connection.backend
+        session_id = backend.session_id(conn)  # read while the connection is idle
+        state = {"done": False, "abandoned": False, "result": None, "error": None}
+        lock = threading.Lock()
+        finished = threading.Event()
+
+        def work():
+            try:
+                state["result"] = call()
+            except Exception as e:
+                state["error"] = e
+            with lock:
+                state["done"] = True
+                abandoned = state["abandoned"]
+            finished.set()
+            if abandoned:  # nobody waits for this connection any more
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+                self.db_connection.discard(conn)
+
+        threading.Thread(target=work, daemon=True).start()
+        start_time = time.monotonic()
+        reason = None
+        try:
+            while not finished.wait(self.poll_seconds):
+                elapsed = time.monotonic() - start_time
+                if self.timeout_seconds and elapsed >= self.timeout_seconds:
+                    reason = f"Query timed out after {self.timeout_seconds:g}s and was cancelled."
+                    break
+                self.show_spinner(elapsed)
+        except KeyboardInterrupt:
+            reason = "Query cancelled."
+        finally:
+            self.clear_spinner(time.monotonic() - start_time)
+        if reason:
+            with lock:
+                if not state["done"]:
+                    state["abandoned"] = True
+            if state["abandoned"]:
+                # stopping the statement can take a round trip on another connection, the session does not wait
+                threading.Thread(target=self.cancel, args=(conn, session_id), daemon=True).start()
+                raise QueryCancelled(reason)
+        if state["error"] is not None:
+            raise state["error"]
+        return state["result"]
+
+    # ask the engine to stop the statement running on a connection
+    def cancel(self, conn, session_id):
+        try:
+            self.db_connection.backend.cancel(conn, session_id, self.db_connection.open_connection)
+        except Exception:
+            pass  # the worker discards the connection whenever the statement ends
+
+    # spinner with the elapsed time, on terminals and only once a query is noticeably slow
+    def show_spinner(self, elapsed):
+        if elapsed < self.spinner_after_seconds or not sys.stdout.isatty():
+            return
+        frame = SPINNER_FRAMES[int(elapsed / self.poll_seconds) % len(SPINNER_FRAMES)]
+        sys.stdout.write(f"\r{frame} Running query... {elapsed:.1f}s (Ctrl-C to cancel)")
+        sys.stdout.flush()
+
+    def clear_spinner(self, elapsed):
+        if elapsed < self.spinner_after_seconds or not sys.stdout.isatty():
+            return
+        sys.stdout.write("\r\033[K")  # erase the spinner line
+        sys.stdout.flush()
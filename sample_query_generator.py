@@ -1,174 +1,244 @@
 # handles sample query construction based on recognized patterns
 
 import random
+from db_config import sample_query_config
+from schema_catalog import SchemaCatalog
+from artifact_store import ArtifactStore
 
+SYSTEMATIC_TEMPLATES = [  # query templates for common patterns
+    {"pattern": "Total <A> by <B>",
+     "sql_template": "SELECT <B>, SUM(<A>) AS total_<A> FROM {table_name} GROUP BY <B>"},
 
-class QueryGenerator:
+    {"pattern": "Average <A> by <B>",
+     "sql_template": "SELECT <B>, AVG(<A>) AS average_<A> FROM {table_name} GROUP BY <B>"},
 
-    def __init__(self, db_connection):
-        self.db_connection = db_connection
+    {"pattern": "Count <B>",
+     "sql_template": "SELECT <B>, COUNT(*) AS count FROM {table_name} GROUP BY <B>"},
 
-    # classifies columns into quantitative and categorical attributes based on their data type
-    def classify_columns(self, table_name):
-        cursor = self.db_connection.get_cursor()
-        cursor.execute(f"SHOW COLUMNS FROM {table_name};")
-        columns = cursor.fetchall()
-        cursor.close()
-
-        quantitative_columns = []  # initialize empty list to hold quantitative columns
-        categorical_columns = []  # initialize empty list to hold categorical columns
-
-        # iterate through all columns, sorting by datatype
-        for column in columns:
-            column_name = column[0]
-            data_type = column[1]
-            base_type = data_type.split('(')[0]  # get the base type
-            if base_type in ["int", "decimal", "double", "bigint"]:
-                quantitative_columns.append(column_name)  # add to quantitative list if numeric
-            elif base_type in ["varchar", "mediumtext", "char", "date", "time"]:
-                categorical_columns.append(column_name)  # add to categorical list if text/date
-
-        return quantitative_columns, categorical_columns  # return classified column lists
+    {"pattern": "Minimum <A> by <B>",
+     "sql_template": "SELECT <B>, MIN(<A>) AS min_<A> FROM {table_name} GROUP BY <B>"},
 
-    # generate systematic queries based on table columns and common sql patterns
-    def generate_systematic_queries(self, table_name):
-        quantitative_columns, categorical_columns = self.classify_columns(table_name)  # classify columns
+    {"pattern": "Maximum <A> by <B>",
+     "sql_template": "SELECT <B>, MAX(<A>) AS max_<A> FROM {table_name} GROUP BY <B>"},
 
-        query_templates = [  # initialize query templates for common patterns
-            {"pattern": "Total <A> by <B>",
-             "sql_template": "SELECT <B>, SUM(<A>) AS total_<A> FROM {table_name} GROUP BY <B>"},
-
-            {"pattern": "Average <A> by <B>",
-             "sql_template": "SELECT <B>, AVG(<A>) AS average_<A> FROM {table_name} GROUP BY <B>"},
-
-            {"pattern": "Count <B>",
-             "sql_template": "SELECT <B>, COUNT(*) AS count FROM {table_name} GROUP BY <B>"},
-
-            {"pattern": "Minimum <A> by <B>",
-             "sql_template": "SELECT <B>, MIN(<A>) AS min_<A> FROM {table_name} GROUP BY <B>"},
-
-            {"pattern": "Maximum <A> by <B>",
-             "sql_template": "SELECT <B>, MAX(<A>) AS max_<A> FROM {table_name} GROUP BY <B>"},
-
-            {"pattern": "Select all records",
-             "sql_template": "SELECT * FROM {table_name}"},
-
-            {"pattern": "Distinct values of <B>",
-             "sql_template": "SELECT DISTINCT <B> FROM {table_name}"}
-        ]
-
-        queries = []  # initialize empty query list to store output
-        # iterate over quantitative and categorical columns to generate queries
-        for quantitative in quantitative_columns:
-            for categorical in categorical_columns:
-                for pattern in query_templates:  # loop through all pattern templates
-                    if "<A>" not in pattern["sql_template"] and "<B>" not in pattern["sql_template"]:
-                        # if no placeholders <A> or <B> are in the pattern, format directly (handles select *)
-                        query = pattern["sql_template"].format(table_name=table_name)
-                        natural_language = pattern["pattern"]
-                        queries.append({"description": natural_language, "query": query})
-                    else:
-                        # replace <A> and <B> placeholders with actual columns
-                        query = pattern["sql_template"].replace("<A>", quantitative).replace("<B>", categorical)
-                        query = query.format(table_name=table_name)
-                        natural_language = pattern["pattern"].replace("<A>", quantitative).replace("<B>", categorical)
-                        queries.append({"description": natural_language, "query": query})
-
-        unique_queries = {query["query"]: query for query in queries}  # ensure queries are unique
-        sampled_queries = random.sample(list(unique_queries.values()), min(3, len(unique_queries)))
-        return sampled_queries  # return list of random queries
+    {"pattern": "Select all records",
+     "sql_template": "SELECT * FROM {table_name}"},
 
-    # generate sample queries based on the specified SQL construct (GROUP BY, ORDER BY, etc.)
-    def generate_queries_by_construct(self, table_name, construct):
-        quantitative_columns, categorical_columns = self.classify_columns(table_name)  # classify columns
+    {"pattern": "Distinct values of <B>",
+     "sql_template": "SELECT DISTINCT <B> FROM {table_name}"}
+]
 
-        query_templates = {
-            "GROUP BY": [  # templates for GROUP BY queries
-                {"pattern": "Total <A> by <B>",
-                 "sql_template": "SELECT <B>, SUM(<A>) AS total_<A> FROM {table_name} GROUP BY <B>"},
+CONSTRUCT_TEMPLATES = {  # query templates for each sql construct
+    "GROUP BY": [  # templates for GROUP BY queries
+        {"pattern": "Total <A> by <B>",
+         "sql_template": "SELECT <B>, SUM(<A>) AS total_<A> FROM {table_name} GROUP BY <B>"},
+
+        {"pattern": "Count <B>",
+         "sql_template": "SELECT <B>, COUNT(*) AS count FROM {table_name} GROUP BY <B>"},
 
-                {"pattern": "Count <B>",
-                 "sql_template": "SELECT <B>, COUNT(*) AS count FROM {table_name} GROUP BY <B>"},
+        {"pattern": "Average <A> by <B>",
+         "sql_template": "SELECT <B>, AVG(<A>) AS average_<A> FROM {table_name} GROUP BY <B>"},
+
+        {"pattern": "Minimum <A> by <B>",
+         "sql_template": "SELECT <B>, MIN(<A>) AS min_<A> FROM {table_name} GROUP BY <B>"},
 
-                {"pattern": "Average <A> by <B>",
-                 "sql_template": "SELECT <B>, AVG(<A>) AS average_<A> FROM {table_name} GROUP BY <B>"},
+        {"pattern": "Maximum <A> by <B>",
+         "sql_template": "SELECT <B>, MAX(<A>) AS max_<A> FROM {table_name} GROUP BY <B>"}
+    ],
 
-                {"pattern": "Minimum <A> by <B>",
-                 "sql_template": "SELECT <B>, MIN(<A>) AS min_<A> FROM {table_name} GROUP BY <B>"},
+    "ORDER BY": [  # templates for ORDER BY queries
+        {"pattern": "Top 5 <B> ordered by <A> descending",
+         "sql_template": "SELECT <B>, <A> FROM {table_name} ORDER BY <A> DESC LIMIT 5"},
 
-                {"pattern": "Maximum <A> by <B>",
-                 "sql_template": "SELECT <B>, MAX(<A>) AS max_<A> FROM {table_name} GROUP BY <B>"}
-            ],
+        {"pattern": "Top 5 <B> ordered by <A> ascending",
+         "sql_template": "SELECT <B>, <A> FROM {table_name} ORDER BY <A> ASC LIMIT 5"},
 
-            "ORDER BY": [  # templates for ORDER BY queries
-                {"pattern": "Top 5 <B> ordered by <A> descending",
-                 "sql_template": "SELECT <B>, <A> FROM {table_name} ORDER BY <A> DESC LIMIT 5"},
+        {"pattern": "All <B> ordered by <A> descending",
+         "sql_template": "SELECT <B>, <A> FROM {table_name} ORDER BY <A> DESC"}
+    ],
 
-                {"pattern": "Top 5 <B> ordered by <A> ascending",
-                 "sql_template": "SELECT <B>, <A> FROM {table_name} ORDER BY <A> ASC LIMIT 5"},
+    "HAVING": [  # templates for HAVING queries
+        {"pattern": "Filter <B> with total <A> greater than <A_GROUP_TOTAL>",
+         "sql_template": "SELECT <B>, SUM(<A>) AS total_<A> FROM {table_name} GROUP BY <B> HAVING total_<A> > "
+                         "<A_GROUP_TOTAL>"},
 
-                {"pattern": "All <B> ordered by <A> descending",
-                 "sql_template": "SELECT <B>, <A> FROM {table_name} ORDER BY <A> DESC"}
-            ],
+        {"pattern": "Filter <B> with average <A> greater than <A_MEDIAN>",
+         "sql_template": "SELECT <B>, AVG(<A>) AS average_<A> FROM {table_name} GROUP BY <B> HAVING "
+                         "average_<A> > <A_MEDIAN>"},
 
-            "HAVING": [  # templates for HAVING queries
-                {"pattern": "Filter <B> with total <A> greater than 100",
-                 "sql_template": "SELECT <B>, SUM(<A>) AS total_<A> FROM {table_name} GROUP BY <B> HAVING total_<A> > "
-                                 "100"},
+        {"pattern": "Filter <B> with count <A> greater than <A_GROUP_COUNT>",
+         "sql_template": "SELECT <B>, COUNT(<A>) AS count_<A> FROM {table_name} GROUP BY <B> "
+                         "HAVING count_<A> > <A_GROUP_COUNT>"}
+    ],
 
-                {"pattern": "Filter <B> with average <A> greater than 50",
-                 "sql_template": "SELECT <B>, AVG(<A>) AS average_<A> FROM {table_name} GROUP BY <B> HAVING "
-                                 "average_<A> > 50"},
+    "WHERE": [  # templates for WHERE queries
+        {"pattern": "Select rows where <A> > <A_HIGH>",
+         "sql_template": "SELECT * FROM {table_name} WHERE <A> > <A_HIGH>"},
 
-                {"pattern": "Filter <B> with count <A> greater than 10",
-                 "sql_template": "SELECT <B>, COUNT(<A>) AS count_<A> FROM {table_name} GROUP BY <B> "
-                                 "HAVING count_<A> > 10"}
-            ],
+        {"pattern": "Select rows where <A> is not null",
+         "sql_template": "SELECT * FROM {table_name} WHERE <A> IS NOT NULL"},
 
-            "WHERE": [  # templates for WHERE queries
-                {"pattern": "Select rows where <A> > 100",
-                 "sql_template": "SELECT * FROM {table_name} WHERE <A> > 100"},
+        {"pattern": "Select rows where <B> is null",
+         "sql_template": "SELECT * FROM {table_name} WHERE <B> IS NULL"},
 
-                {"pattern": "Select rows where <A> is not null",
-                 "sql_template": "SELECT * FROM {table_name} WHERE <A> IS NOT NULL"},
+        {"pattern": "Select rows where <A> between <A_RANGE_LOW> and <A_RANGE_HIGH>",
+         "sql_template": "SELECT * FROM {table_name} WHERE <A> BETWEEN <A_RANGE_LOW> AND <A_RANGE_HIGH>"},
 
-                {"pattern": "Select rows where <B> is null",
-                 "sql_template": "SELECT * FROM {table_name} WHERE <B> IS NULL"},
+        {"pattern": "Select rows where <A> like '%<B>%'",
+         "sql_template": "SELECT * FROM {table_name} WHERE <A> LIKE '%<B>%'"},
 
-                {"pattern": "Select rows where <A> between <value1> and <value2>",
-                 "sql_template": "SELECT * FROM {table_name} WHERE <A> BETWEEN <value1> AND <value2>"},
+        {"pattern": "Select rows where <A> >= <A_LOWER> and <A> <= <A_UPPER>",
+         "sql_template": "SELECT * FROM {table_name} WHERE <A> >= <A_LOWER> AND <A> <= <A_UPPER>"},
 
-                {"pattern": "Select rows where <A> like '%<B>%'",
-                 "sql_template": "SELECT * FROM {table_name} WHERE <A> LIKE '%<B>%'"},
+        {"pattern": "Select rows where <A> in ('<A_VALUE1>', '<A_VALUE2>', '<A_VALUE3>')",
+         "sql_template": "SELECT * FROM {table_name} WHERE <A> IN ('<A_VALUE1>', '<A_VALUE2>', '<A_VALUE3>')"}
+    ]
+}
 
-                {"pattern": "Select rows where <A> >= 100 and <A> <= 200",
-                 "sql_template": "SELECT * FROM {table_name} WHERE <A> >= 100 AND <A> <= 200"},
+LITERAL_DEFAULTS = {  # template literals used when a table has no column statistics
+    "<A_HIGH>": "100", "<A_RANGE_LOW>": "<value1>", "<A_RANGE_HIGH>": "<value2>", "<A_LOWER>": "100",
+    "<A_UPPER>": "200", "<A_VALUE1>": "<val1>", "<A_VALUE2>": "<val2>", "<A_VALUE3>": "<val3>",
+    "<A_GROUP_TOTAL>": "100", "<A_MEDIAN>": "50", "<A_GROUP_COUNT>": "10"
+}
 
-                {"pattern": "Select rows where <A> in ('<val1>', '<val2>', '<val3>')",
-                 "sql_template": "SELECT * FROM {table_name} WHERE <A> IN ('<val1>', '<val2>', '<val3>')"}
-            ]
-        }
 
-        if construct.upper() not in query_templates:  # if construct is not valid, return empty list
-            return []
+# number as a short sql literal
+def format_literal(value):
+    return str(int(value)) if float(value).is_integer() else f"{value:.2f}"
+
 
-        queries = []  # initialize list for storing queries
-        templates = query_templates[construct.upper()]  # get templates for the specified construct
-        for quantitative in quantitative_columns:
-            for categorical in categorical_columns:
-                for template in templates:  # loop through each template
-                    if "<A>" not in template["sql_template"] and "<B>" not in template["sql_template"]:
-                        # if no placeholders <A> or <B> are present, directly format the query
-                        query = template["sql_template"].format(table_name=table_name)
-                        natural_language = template["pattern"]
-                        queries.append({"description": natural_language, "query": query})
-                    else:
-                        # replace placeholders <A> and <B> with actual columns
-                        query = template["sql_template"].replace("<A>", quantitative).replace("<B>", categorical)
-                        query = query.format(table_name=table_name)
-                        natural_language = template["pattern"].replace("<A>", quantitative).replace("<B>", categorical)
-                        queries.append({"description": natural_language, "query": query})
-
-        unique_queries = {query["query"]: query for query in queries}  # ensure queries are unique
-        sampled_queries_construct = random.sample(list(unique_queries.values()), min(3, len(unique_queries)))
-        return sampled_queries_construct  # return the sampled queries
+# template literals for a column pair, picked from the column statistics so filters keep part of the table
+def template_literals(quantitative_column, categorical_column, column_stats):
+    literals = dict(LITERAL_DEFAULTS)
+    if not column_stats:
+        return literals
+    columns = column_stats["columns"]
+    quantitative = columns.get(quantitative_column.lower(), {})
+    quantiles = quantitative.get("quantiles", {})
+    if quantiles:
+        literals["<A_HIGH>"] = format_literal(quantiles["p90"])  # about a tenth of the rows
+        literals["<A_RANGE_LOW>"] = format_literal(quantiles["p25"])  # the middle half
+        literals["<A_RANGE_HIGH>"] = format_literal(quantiles["p75"])
+        literals["<A_LOWER>"] = format_literal(quantiles["p50"])  # the upper middle quarter
+        literals["<A_UPPER>"] = format_literal(quantiles["p75"])
+        literals["<A_MEDIAN>"] = format_literal(quantiles["p50"])
+    for idx, (value, _) in enumerate(quantitative.get("top_values", [])[:3]):  # the most frequent values
+        literals[f"<A_VALUE{idx + 1}>"] = value.replace("'", "''")
+
+    categorical = columns.get(categorical_column.lower(), {})
+    if categorical.get("distinct_count"):
+        # an average sized group, so HAVING keeps the larger half of the groups
+        group_size = (column_stats["row_count"] - quantitative.get("null_count", 0)) / categorical["distinct_count"]
+        literals["<A_GROUP_COUNT>"] = format_literal(round(group_size))
+        if quantiles:
+            literals["<A_GROUP_TOTAL>"] = format_literal(round(quantiles["p50"] * group_size))
+    return literals
+
+
+# replace template placeholders with columns and literals
+def fill_template(text, quantitative_column, categorical_column, literals):
+    for placeholder, literal in literals.items():
+        text = text.replace(placeholder, literal)
+    return text.replace("<A>", quantitative_column).replace("<B>", categorical_column)
+
+
+class QueryGenerator:
+
+    def __init__(self, db_connection, schema_catalog=None):
+        self.db_connection = db_connection
+        self.schema_catalog = schema_catalog or SchemaCatalog(db_connection)  # cached column metadata
+        self.schema_catalog.add_listener(self.forget_table)  # drop cached statistics on upload/remove
+        self.artifact_store = ArtifactStore(db_connection.database)  # column statistics built at upload time
+        self.column_stats = {}  # table name -> column statistics, loaded lazily
+
+    # forget cached column statistics of a table, or of every table when none is given
+    def forget_table(self, table_name=None):
+        if table_name is None:
+            self.column_stats = {}
+        else:
+            self.column_stats.pop(table_name.lower(), None)
+
+    # column statistics of a table keyed by lowercase column name, None until the table has been profiled
+    def get_column_stats(self, table_name):
+        key = table_name.lower()
+        stats = self.column_stats.get(key)
+        if stats is None:
+            stats = self.artifact_store.load("stats", table_name)
+            if stats is None:
+                return None  # not cached, so statistics built later by an analyze are picked up
+            stats["columns"] = {name.lower(): column for name, column in stats["columns"].items()}
+            self.column_stats[key] = stats
+        return stats
+
+    # classifies columns into quantitative and categorical attributes based on their data type
+    def classify_columns(self, table_name):
+        classification = self.schema_catalog.classify_columns(table_name)  # cached per table
+        return classification["quantitative"], classification["categorical"]  # return classified column lists
+
+    # categorical columns with few enough distinct values for a readable GROUP BY result
+    @staticmethod
+    def grouping_columns(categorical_columns, column_stats):
+        if not column_stats:
+            return categorical_columns
+        distinct_counts = {name: column_stats["columns"].get(name.lower(), {}).get("distinct_count", 0)
+                           for name in categorical_columns}
+        grouping = [name for name in categorical_columns
+                    if distinct_counts[name] <= sample_query_config["group_by_max_distinct"]]
+        # every column is high cardinality: the one with the fewest groups is still the best example
+        return grouping or [min(categorical_columns, key=distinct_counts.get)]
+
+    # pick k distinct queries uniformly from the column x column x template space without building it
+    @staticmethod
+    def sample_queries(table_name, templates, quantitative_columns, categorical_columns, k=3, column_stats=None):
+        if not quantitative_columns or not categorical_columns:
+            return []  # every query is built from a quantitative and a categorical column pair
+        grouping_columns = QueryGenerator.grouping_columns(categorical_columns, column_stats)
+
+        # a template only multiplies by the placeholders its sql uses, so each index is one distinct query
+        counts = []
+        template_columns = []  # categorical columns each template can use
+        for template in templates:
+            columns = grouping_columns if "GROUP BY" in template["sql_template"] else categorical_columns
+            count = 1
+            if "<A>" in template["sql_template"]:
+                count *= len(quantitative_columns)
+            if "<B>" in template["sql_template"]:
+                count *= len(columns)
+            counts.append(count)
+            template_columns.append(columns)
+        total = sum(counts)
+
+        queries = []
+        for index in random.sample(range(total), min(k, total)):  # o(k) draw of distinct indexes
+            for template, columns, count in zip(templates, template_columns, counts):  # the template of the index
+                if index < count:
+                    break
+                index -= count
+            quantitative = categorical = ""
+            if "<B>" in template["sql_template"]:
+                index, categorical_idx = divmod(index, len(columns))
+                categorical = columns[categorical_idx]
+            if "<A>" in template["sql_template"]:
+                quantitative = quantitative_columns[index]
+            # replace placeholders <A> and <B> with actual columns and literals with values from the statistics
+            literals = template_literals(quantitative, categorical, column_stats)
+            query = fill_template(template["sql_template"], quantitative, categorical, literals)
+            query = query.format(table_name=table_name)
+            natural_language = fill_template(template["pattern"], quantitative, categorical, literals)
+            queries.append({"description": natural_language, "query": query})
+        return queries
+
+    # generate systematic queries based on table columns and common sql patterns
+    def generate_systematic_queries(self, table_name):
+        quantitative_columns, categorical_columns = self.classify_columns(table_name)  # classify columns
+        return self.sample_queries(table_name, SYSTEMATIC_TEMPLATES, quantitative_columns, categorical_columns,
+                                   column_stats=self.get_column_stats(table_name))  # return list of random queries
+
+    # generate sample queries based on the specified SQL construct (GROUP BY, ORDER BY, etc.)
+    def generate_queries_by_construct(self, table_name, construct):
+        if construct.upper() not in CONSTRUCT_TEMPLATES:  # if construct is not valid, return empty list
+            return []
+        quantitative_columns, categorical_columns = self.classify_columns(table_name)  # classify columns
+        return self.sample_queries(table_name, CONSTRUCT_TEMPLATES[construct.upper()], quantitative_columns,
+                                   categorical_columns,
+                                   column_stats=self.get_column_stats(table_name))  # return the sampled queries
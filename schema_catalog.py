@@ -0,0 +1,184 @@
+# in-process cache of column metadata shared by the chatdb components
+
+import threading
+import time
+from db_config import cache_config
+from approximate import is_sample_table
+from upload_checkpoints import is_checkpoint_table
+
+QUANTITATIVE_TYPES = {"int", "decimal", "double", "bigint"}  # numeric base types
+CATEGORICAL_TYPES = {"varchar", "mediumtext", "char", "date", "time", "datetime"}  # text/date base types
+
+
+class TableRegistry:
+
+    def __init__(self, db_connection, revalidate_seconds=None):
+        self.db_connection = db_connection
+        self.names = None  # table names in listing order, loaded on first use
+        self.listed_count = 0  # tables on the server including the hidden sample and checkpoint tables
+        self.name_set = set()  # lowercase names for constant-time lookups
+        self.version = 0  # bumped whenever the set of tables changes
+        self.fingerprint = None  # (table count, latest create time) at the last listing
+        self.checked_at = 0.0  # when the fingerprint was last compared with the server
+        self.revalidate_seconds = (cache_config["table_revalidate_seconds"] if revalidate_seconds is None
+                                   else revalidate_seconds)
+        self.lock = threading.Lock()
+
+    # one-row summary of the schema that changes whenever a table is created or dropped
+    def fetch_fingerprint(self):
+        cursor = self.db_connection.get_cursor()
+        try:
+            return self.db_connection.backend.fingerprint(cursor, self.db_connection.database)
+        finally:
+            cursor.close()
+
+    # full listing of the tables in the database
+    def refresh(self):
+        fingerprint = self.fetch_fingerprint()
+        cursor = self.db_connection.get_cursor()
+        try:
+            listed = self.db_connection.backend.list_tables(cursor, self.db_connection.database)
+        finally:
+            cursor.close()
+        names = [name for name in listed if not is_sample_table(name) and not is_checkpoint_table(name)]
+        self.listed_count = len(listed)
+        if self.names is not None and names != self.names:
+            self.version += 1
+        self.names = names
+        self.name_set = {name.lower() for name in names}
+        self.fingerprint = fingerprint
+        self.checked_at = time.monotonic()
+
+    # reload the listing only if it was never loaded or the server fingerprint moved
+    def revalidate(self):
+        if self.names is None:
+            self.refresh()
+            return
+        if time.monotonic() - self.checked_at < self.revalidate_seconds:
+            return
+        fingerprint = self.fetch_fingerprint()
+        self.checked_at = time.monotonic()
+        if fingerprint != self.fingerprint:
+            self.refresh()
+
+    # table names in the database
+    def tables(self):
+        with self.lock:
+            self.revalidate()
+            return list(self.names)
+
+    def __contains__(self, table_name):
+        with self.lock:
+            self.revalidate()
+            return table_name.lower() in self.name_set
+
+    # record a table created by this session without relisting
+    def add(self, table_name):
+        with self.lock:
+            if self.names is None or table_name.lower() in self.name_set:
+                return
+            self.names.append(table_name)
+            self.name_set.add(table_name.lower())
+            self.listed_count += 1
+            self.version += 1
+            self.sync_fingerprint()
+
+    # record a table dropped by this session without relisting
+    def remove(self, table_name):
+        with self.lock:
+            if self.names is None or table_name.lower() not in self.name_set:
+                return
+            self.names = [name for name in self.names if name.lower() != table_name.lower()]
+            self.name_set.discard(table_name.lower())
+            self.listed_count -= 1
+            self.version += 1
+            self.sync_fingerprint()
+
+    # store the new fingerprint after a local change, relisting only if another session changed tables too
+    def sync_fingerprint(self):
+        fingerprint = self.fetch_fingerprint()
+        if fingerprint[0] != self.listed_count:
+            self.refresh()
+            return
+        self.fingerprint = fingerprint
+        self.checked_at = time.monotonic()
+
+
+class SchemaCatalog:
+
+    def __init__(self, db_connection):
+        self.db_connection = db_connection
+        self.table_registry = TableRegistry(db_connection)  # cached table list shared with the menus
+        self.columns = None  # table name -> [(column name, data type)], loaded on first use
+        self.classifications = {}  # table name -> {"quantitative": [...], "categorical": [...]}
+        self.registry_version = 0  # table registry version the cached columns belong to
+        self.listeners = []  # callbacks told which table changed, None meaning every table
+        self.lock = threading.Lock()
+
+    # register a callback that drops derived per-table state whenever the catalog is invalidated
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    # load the columns of every table in the database with one metadata query
+    def load(self):
+        cursor = self.db_connection.get_cursor()
+        try:
+            rows = self.db_connection.backend.describe_columns(cursor, self.db_connection.database)
+        finally:
+            cursor.close()
+
+        columns = {}
+        for table_name, column_name, data_type in rows:
+            columns.setdefault(table_name.lower(), []).append((column_name, data_type))
+        self.columns = columns
+        self.classifications = {}
+
+    # load the columns of a single table that is missing from the catalog
+    def load_table(self, table_name):
+        cursor = self.db_connection.get_cursor()
+        try:
+            rows = self.db_connection.backend.describe_columns(cursor, self.db_connection.database, table_name)
+        finally:
+            cursor.close()
+        self.columns[table_name.lower()] = [(column_name, data_type) for _, column_name, data_type in rows]
+
+    # column names and data types of a table, in table order
+    def get_columns(self, table_name):
+        with self.lock:
+            if self.registry_version != self.table_registry.version:  # tables were created or dropped
+                self.columns = None
+                self.registry_version = self.table_registry.version
+            if self.columns is None:
+                self.load()
+            if table_name.lower() not in self.columns:
+                self.load_table(table_name)
+            return self.columns[table_name.lower()]
+
+    # classify the columns of a table into quantitative and categorical attributes, computed once per table
+    def classify_columns(self, table_name):
+        key = table_name.lower()
+        with self.lock:
+            classification = self.classifications.get(key)
+        if classification is None:
+            classification = {"quantitative": [], "categorical": []}
+            for column_name, data_type in self.get_columns(table_name):  # takes the lock itself
+                if data_type in QUANTITATIVE_TYPES:
+                    classification["quantitative"].append(column_name)  # add to quantitative list if numeric
+                elif data_type in CATEGORICAL_TYPES:
+                    classification["categorical"].append(column_name)  # add to categorical list if text/date
+            with self.lock:
+                classification = self.classifications.setdefault(key, classification)
+        return classification
+
+    # drop cached metadata for one table, or for every table when no name is given
+    def invalidate(self, table_name=None):
+        with self.lock:
+            if table_name is None:
+                self.columns = None
+                self.classifications = {}
+            else:
+                if self.columns is not None:
+                    self.columns.pop(table_name.lower(), None)
+                self.classifications.pop(table_name.lower(), None)
+        for callback in self.listeners:
+            callback(table_name)
@@ -0,0 +1,72 @@
+# incremental text table renderer shared by query results and the explore view
+
+import sys
+
+WIDTH_SAMPLE_ROWS = 100  # rows used to size the columns when no widths are given
+MAX_CELL_WIDTH = 40  # longer values are truncated with an ellipsis
+FLUSH_ROWS = 1000  # rows formatted before they are written out in one call
+
+
+class TableRenderer:
+
+    def __init__(self, column_names=None, sample_rows=(), widths=None, max_cell_width=MAX_CELL_WIDTH, out=None):
+        self.column_names = list(column_names) if column_names else None
+        self.max_cell_width = max_cell_width
+        self.out = out or sys.stdout
+        self.widths = widths or self.fit_widths(sample_rows)
+        total_width = sum(self.widths) + len(self.widths) * 3 + 1  # adjust for borders and spacing
+        self.border = "+" + "-" * (total_width - 2) + "+"
+
+    # column widths from the header and the first rows, capped so one long value cannot blow up the table
+    def fit_widths(self, sample_rows):
+        sample_rows = list(sample_rows[:WIDTH_SAMPLE_ROWS])
+        column_count = len(self.column_names) if self.column_names else max(len(row) for row in sample_rows)
+        widths = [len(str(name)) for name in self.column_names] if self.column_names else [0] * column_count
+        for row in sample_rows:
+            for idx, value in enumerate(row[:column_count]):
+                widths[idx] = max(widths[idx], len(str(value)))
+        return [min(width, self.max_cell_width) for width in widths]
+
+    # pad or truncate one value to its column width, converting it to text only once
+    def format_cell(self, value, width):
+        text = str(value)
+        if len(text) > width:
+            text = text[:width - 3] + "..." if width > 3 else text[:width]
+        return f"{text:<{width}}"
+
+    # one table line with borders
+    def format_row(self, row):
+        return "| " + " | ".join(self.format_cell(value, width) for value, width in zip(row, self.widths)) + " |"
+
+    # write formatted lines in one call
+    def write_lines(self, lines):
+        if lines:
+            self.out.write("\n".join(lines) + "\n")
+
+    # top border and, when column names are known, the header row
+    def write_header(self):
+        lines = [self.border]
+        if self.column_names:
+            lines += [self.format_row(self.column_names), self.border]
+        self.write_lines(lines)
+
+    # rows of the table body, written in chunks so memory stays bounded for any row iterable
+    def write_rows(self, rows):
+        lines = []
+        for row in rows:
+            lines.append(self.format_row(row))
+            if len(lines) >= FLUSH_ROWS:
+                self.write_lines(lines)
+                lines = []
+        self.write_lines(lines)
+
+    # bottom border
+    def write_footer(self):
+        self.write_lines([self.border])
+        self.out.flush()
+
+    # header, rows and footer of a complete table
+    def write_table(self, rows):
+        self.write_header()
+        self.write_rows(rows)
+        self.write_footer()
@@ -0,0 +1,144 @@
+# per-stage timing of question answering: spans with latency, rows, bytes and cache hits, exported as
+# json lines or prometheus text
+
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from db_config import tracing_config
+
+PERCENTILES = (50, 95, 99)
+
+
+class Span:
+
+    def __init__(self, tracer, stage, trace_id, attrs):
+        self.tracer = tracer
+        self.stage = stage
+        self.trace_id = trace_id
+        self.attrs = dict(attrs)  # rows, bytes, cache_hit and other measurements of the stage
+        self.seconds = 0.0  # time spent in the stage, summed over its timed sections
+        self.started = False  # a span that was never timed records nothing
+
+    # time one section of the stage, a stage interleaved with other work is timed in several sections
+    @contextmanager
+    def timed(self):
+        self.started = True
+        start_time = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds += time.perf_counter() - start_time
+
+    # set measurements of the stage
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    # add to counted measurements of the stage
+    def add(self, **counts):
+        for name, count in counts.items():
+            self.attrs[name] = self.attrs.get(name, 0) + count
+
+    # record the finished stage
+    def finish(self):
+        if self.started:
+            self.tracer.record(self)
+
+
+class Tracer:
+
+    def __init__(self, max_spans=None, jsonl_path=None):
+        self.spans = deque(maxlen=max_spans or tracing_config["max_spans"])  # finished spans of the session
+        self.jsonl_path = jsonl_path or tracing_config["jsonl_path"]
+        self.jsonl_file = None  # opened on the first recorded span
+        self.trace_ids = itertools.count(1)
+        self.local = threading.local()  # trace id of the question being answered on each thread
+        self.lock = threading.Lock()
+
+    # group the spans recorded from now on by this thread under a new trace id
+    def start_trace(self):
+        self.local.trace_id = next(self.trace_ids)
+        return self.local.trace_id
+
+    # span that the caller times in sections and finishes itself
+    def begin(self, stage, **attrs):
+        return Span(self, stage, getattr(self.local, "trace_id", None), attrs)
+
+    # span timing the whole with block
+    @contextmanager
+    def span(self, stage, **attrs):
+        span = self.begin(stage, **attrs)
+        try:
+            with span.timed():
+                yield span
+        finally:
+            span.finish()
+
+    # keep a finished span and append it to the json lines file when one is configured
+    def record(self, span):
+        entry = {"trace": span.trace_id, "stage": span.stage, "ms": round(span.seconds * 1000, 3),
+                 "at": time.time(), **span.attrs}
+        with self.lock:
+            self.spans.append(entry)
+            if self.jsonl_path:
+                if self.jsonl_file is None:
+                    self.jsonl_file = open(self.jsonl_path, "a", encoding="utf-8")
+                self.jsonl_file.write(json.dumps(entry, default=str) + "\n")
+                self.jsonl_file.flush()
+
+    # per-stage count, latency percentiles in ms, total rows and bytes, and cache hit rate
+    def summary(self):
+        with self.lock:
+            spans = list(self.spans)
+        stages = {}
+        for entry in spans:
+            stages.setdefault(entry["stage"], []).append(entry)
+        summary = {}
+        for stage, entries in stages.items():
+            latencies = np.array([entry["ms"] for entry in entries])
+            cache_lookups = [entry["cache_hit"] for entry in entries if "cache_hit" in entry]
+            summary[stage] = {
+                "count": len(entries),
+                **{f"p{p}": float(value) for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))},
+                "total_ms": float(latencies.sum()),
+                "rows": sum(entry.get("rows", 0) for entry in entries),
+                "bytes": sum(entry.get("bytes", 0) for entry in entries),
+                "cache_hit_rate": sum(cache_lookups) / len(cache_lookups) if cache_lookups else None
+            }
+        return summary
+
+    # write the session summary as prometheus text exposition format
+    def write_prometheus(self, path=None):
+        path = path or tracing_config["prometheus_path"]
+        if not path:
+            return None
+        lines = ["# TYPE chatdb_stage_seconds summary"]
+        row_lines = ["# TYPE chatdb_stage_rows_total counter"]
+        byte_lines = ["# TYPE chatdb_stage_bytes_total counter"]
+        for stage, stats in self.summary().items():
+            for p in PERCENTILES:
+                lines.append(f'chatdb_stage_seconds{{stage="{stage}",quantile="{p / 100}"}} {stats[f"p{p}"] / 1000}')
+            lines.append(f'chatdb_stage_seconds_sum{{stage="{stage}"}} {stats["total_ms"] / 1000}')
+            lines.append(f'chatdb_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+            row_lines.append(f'chatdb_stage_rows_total{{stage="{stage}"}} {stats["rows"]}')
+            byte_lines.append(f'chatdb_stage_bytes_total{{stage="{stage}"}} {stats["bytes"]}')
+        lines += row_lines + byte_lines
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)  # scrapers never read a half-written file
+        return path
+
+    # flush and close the json lines file
+    def close(self):
+        with self.lock:
+            if self.jsonl_file is not None:
+                self.jsonl_file.close()
+                self.jsonl_file = None
+
+
+tracer = Tracer()  # session-wide tracer shared by the chatdb components
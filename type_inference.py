@@ -0,0 +1,261 @@
+# vectorized column type inference for uploaded datasets
+
+import math
+import random
+import re
+import numpy as np
+import pandas as pd
+from column_stats import ColumnSketches
+
+# value classes, a value gets the most specific class it matches
+EMPTY, INT, DECIMAL, DATE, DATETIME, BOOLEAN, TEXT = range(7)
+
+# one regex pass classifies every value, the first group that matches decides the class; matched with re.ASCII so
+# \d is only 0-9, digits of other scripts are text as the number parsers do not read them
+VALUE_PATTERN = (r"^(?:(?P<int>[+-]?\d+)"
+                 r"|(?P<decimal>[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?(?i:nan|inf|infinity))"
+                 r"|(?P<date>\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4})"
+                 r"|(?P<datetime>\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)"
+                 r"|(?P<boolean>(?i:true|false)))$")
+GROUP_CLASSES = [("int", INT), ("decimal", DECIMAL), ("date", DATE), ("datetime", DATETIME), ("boolean", BOOLEAN)]
+
+INT_RANGE = (-2 ** 31, 2 ** 31 - 1)  # values outside this range need BIGINT
+BIGINT_RANGE = (-2 ** 63, 2 ** 63 - 1)  # values outside this range need an exact decimal
+EXACT_FLOAT_LIMIT = 2 ** 53  # integers below this magnitude survive a round trip through float64
+
+
+# classify every value of a 2d block of strings at once, returns (class codes, raw lengths, numeric values)
+def classify_values(values):
+    flat = pd.Series(values.ravel(), dtype=object)
+    stripped = flat.str.strip()
+    groups = stripped.str.extract(VALUE_PATTERN, flags=re.ASCII)  # one regex pass over all columns
+
+    codes = np.full(len(flat), TEXT, dtype=np.int8)
+    for group, value_class in reversed(GROUP_CLASSES):  # earlier groups win, so assign them last
+        codes[groups[group].notna().to_numpy()] = value_class
+    codes[(stripped == "").to_numpy()] = EMPTY
+
+    lengths = flat.str.len().to_numpy(dtype=np.int64)  # varchar sizes use the unstripped value, as before
+    numbers = np.full(len(flat), np.nan, dtype=np.float64)  # parsed value of int and decimal cells, nan elsewhere
+    number_mask = (codes == INT) | (codes == DECIMAL)
+    if number_mask.any():
+        parsed = pd.to_numeric(stripped[number_mask], errors="coerce").to_numpy(dtype=np.float64)
+        numbers[number_mask] = parsed
+        # a value the parser cannot read is text, only a literal nan may parse to nan
+        unparsed = np.isnan(parsed) & ~stripped[number_mask].str.lower().str.lstrip("+-").eq("nan").to_numpy()
+        codes[np.flatnonzero(number_mask)[unparsed]] = TEXT
+    return codes.reshape(values.shape), lengths.reshape(values.shape), numbers.reshape(values.shape)
+
+
+# lay a block of csv rows out as a 2d array, missing trailing cells stay empty and extra cells are ignored
+def block_values(header, rows):
+    width = len(header)
+    values = np.full((len(rows), width), "", dtype=object)
+    for row_idx, row in enumerate(rows):
+        cells = row[:width]
+        values[row_idx, :len(cells)] = cells
+    return values
+
+
+# summarize a block of csv rows per column: value classes seen, empty count, longest value and numeric range
+def summarize_block(header, rows, values=None):
+    width = len(header)
+    if values is None:
+        values = block_values(header, rows)
+
+    summary = empty_summary(width)
+    if len(rows):
+        codes, lengths, numbers = classify_values(values)
+        for value_class in range(TEXT + 1):
+            summary["seen"][:, value_class] = (codes == value_class).any(axis=0)
+        summary["empty_counts"] = (codes == EMPTY).sum(axis=0)
+        summary["max_lengths"] = np.where(codes != EMPTY, lengths, 0).max(axis=0)
+        summary["int_mins"], summary["int_maxs"] = integer_ranges(values, codes, numbers)
+        with np.errstate(invalid="ignore"):
+            has_number = ~np.isnan(numbers).all(axis=0)
+            summary["min_values"][has_number] = np.nanmin(numbers[:, has_number], axis=0)
+            summary["max_values"][has_number] = np.nanmax(numbers[:, has_number], axis=0)
+    return summary
+
+
+# exact smallest and largest integer of every column as python ints (None without integers); floats are exact
+# for most values, only cells too large for a float are parsed again from their text
+def integer_ranges(values, codes, numbers):
+    int_mins = np.full(values.shape[1], None, dtype=object)
+    int_maxs = np.full(values.shape[1], None, dtype=object)
+    int_cells = codes == INT
+    for column_idx in np.flatnonzero(int_cells.any(axis=0)):
+        column_cells = int_cells[:, column_idx]
+        column_numbers = numbers[column_cells, column_idx]
+        large = np.abs(column_numbers) >= EXACT_FLOAT_LIMIT
+        candidates = [int(value) for value in pd.unique(values[column_cells, column_idx][large])]
+        if not large.all():
+            candidates += [int(column_numbers[~large].min()), int(column_numbers[~large].max())]
+        int_mins[column_idx], int_maxs[column_idx] = min(candidates), max(candidates)
+    return int_mins, int_maxs
+
+
+# elementwise min or max of two object arrays of python ints where None means no value
+def combine_ints(first, second, pick):
+    return np.array([second_value if first_value is None else
+                     first_value if second_value is None else pick(first_value, second_value)
+                     for first_value, second_value in zip(first, second)], dtype=object)
+
+
+# summary of a block with no rows
+def empty_summary(width):
+    return {"seen": np.zeros((width, TEXT + 1), dtype=bool),
+            "empty_counts": np.zeros(width, dtype=np.int64),
+            "max_lengths": np.zeros(width, dtype=np.int64),
+            "int_mins": np.full(width, None, dtype=object),
+            "int_maxs": np.full(width, None, dtype=object),
+            "min_values": np.full(width, np.nan, dtype=np.float64),
+            "max_values": np.full(width, np.nan, dtype=np.float64)}
+
+
+# combine two block summaries of the same columns into one
+def merge_summaries(first, second):
+    return {"seen": first["seen"] | second["seen"],
+            "empty_counts": first["empty_counts"] + second["empty_counts"],
+            "max_lengths": np.maximum(first["max_lengths"], second["max_lengths"]),
+            "int_mins": combine_ints(first["int_mins"], second["int_mins"], min),
+            "int_maxs": combine_ints(first["int_maxs"], second["int_maxs"], max),
+            "min_values": np.fmin(first["min_values"], second["min_values"]),  # fmin/fmax skip nan
+            "max_values": np.fmax(first["max_values"], second["max_values"])}
+
+
+# pick the MySQL type for each column from its block summary
+def column_types_from_summary(summary):
+    column_types = []
+    for seen, max_length, int_min, int_max in zip(summary["seen"], summary["max_lengths"], summary["int_mins"],
+                                                  summary["int_maxs"]):
+        present = {value_class for value_class in range(INT, TEXT + 1) if seen[value_class]}
+        if present <= {INT}:  # columns without any values default to INT, as before
+            if int_min is None or (INT_RANGE[0] <= int_min and int_max <= INT_RANGE[1]):
+                column_types.append("INT")
+            elif BIGINT_RANGE[0] <= int_min and int_max <= BIGINT_RANGE[1]:
+                column_types.append("BIGINT")
+            else:
+                column_types.append("DECIMAL(65, 0)")
+        elif present <= {INT, DECIMAL}:
+            column_types.append("DECIMAL(20, 6)")
+        elif present <= {DATE}:
+            column_types.append("DATE")
+        elif present <= {DATE, DATETIME}:
+            column_types.append("DATETIME")
+        elif present <= {BOOLEAN}:
+            column_types.append("BOOLEAN")
+        else:
+            column_types.append(f"VARCHAR({max_length if max_length > 0 else 255})")  # longest text in the data
+    return column_types
+
+
+# infer the MySQL type of every column from a block of sample rows, returns types in header order
+def infer_column_types(header, rows):
+    return column_types_from_summary(summarize_block(header, rows))
+
+
+# uniform fixed-size sample of a row stream in one pass (algorithm L, skips ahead instead of drawing per row)
+class ReservoirSampler:
+
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.rows = []
+        self.seen_count = 0  # rows offered so far
+        self.random = random.Random(seed)
+        self.weight = 1.0
+        self.next_index = size  # index of the next row that replaces a reservoir slot
+        self.advance()
+
+    # draw the position of the next row to keep
+    def advance(self):
+        if self.size <= 0:
+            self.next_index = math.inf
+            return
+        self.weight *= math.exp(math.log(1.0 - self.random.random()) / self.size)
+        if self.weight >= 1.0:
+            self.next_index += 1
+            return
+        skip = math.floor(math.log(1.0 - self.random.random()) / math.log(1.0 - self.weight))
+        self.next_index += skip + 1
+
+    # offer the next row of the stream
+    def add(self, row):
+        if self.seen_count < self.size:
+            self.rows.append(row)
+        elif self.seen_count == self.next_index - 1:
+            self.rows[self.random.randrange(self.size)] = row
+            self.advance()
+        self.seen_count += 1
+
+    # fold in a sampler of another part of the stream, leaving a uniform sample of both parts
+    def merge(self, other):
+        total_count = self.seen_count + other.seen_count
+        keep_count = min(self.size, len(self.rows) + len(other.rows))
+        remaining = [self.seen_count, other.seen_count]
+        from_self = 0
+        for _ in range(keep_count):  # each slot goes to a part in proportion to the rows it has left to give
+            if self.random.random() * (remaining[0] + remaining[1]) < remaining[0]:
+                remaining[0] -= 1
+                from_self += 1
+            else:
+                remaining[1] -= 1
+        self.rows = (self.random.sample(self.rows, from_self) +
+                     self.random.sample(other.rows, keep_count - from_self))
+        self.seen_count = total_count
+        if total_count >= self.size:  # resume skipping at the rate a sampler that saw every row would have
+            self.weight = self.size / total_count
+            self.next_index = total_count
+            self.advance()
+
+
+# streaming schema statistics over a whole file: value classes, lengths and numeric ranges plus a row sample
+class SchemaProfiler:
+
+    def __init__(self, header, reservoir_size=1000, max_distinct=50, seed=None):
+        self.header = header
+        self.summary = empty_summary(len(header))
+        self.reservoir = ReservoirSampler(reservoir_size, seed)
+        self.row_count = 0
+        self.max_distinct = max_distinct  # columns with more distinct values stop being tracked
+        self.distinct_values = [set() for _ in header]  # stripped non-empty values, None once over the limit
+        self.sketches = ColumnSketches(len(header))  # distinct counts and top values for the column statistics
+        self.declared_types = None  # types from the file's own schema, None where the values decide
+
+    # fold a block of rows into the running statistics
+    def update(self, rows):
+        values = block_values(self.header, rows)
+        self.summary = merge_summaries(self.summary, summarize_block(self.header, rows, values))
+        for column_idx, distinct in enumerate(self.distinct_values):
+            if distinct is None:
+                continue
+            distinct.update(pd.unique(pd.Series(values[:, column_idx], dtype=object).str.strip()))
+            distinct.discard("")
+            if len(distinct) > self.max_distinct:
+                self.distinct_values[column_idx] = None  # high cardinality, not worth keeping
+        self.sketches.update(values)
+        for row in rows:
+            self.reservoir.add(row)
+        self.row_count += len(rows)
+
+    # fold in the profile of another file with the same header, e.g. another partition of one dataset
+    def merge(self, other):
+        self.summary = merge_summaries(self.summary, other.summary)
+        for column_idx, (distinct, other_distinct) in enumerate(zip(self.distinct_values, other.distinct_values)):
+            if distinct is None or other_distinct is None or len(distinct | other_distinct) > self.max_distinct:
+                self.distinct_values[column_idx] = None
+            else:
+                distinct.update(other_distinct)
+        self.sketches.merge(other.sketches)
+        self.reservoir.merge(other.reservoir)
+        self.row_count += other.row_count
+        if self.declared_types is not None:  # partitions that disagree on a column type leave it to the values
+            self.declared_types = [declared if declared == other_declared else None for declared, other_declared
+                                   in zip(self.declared_types, other.declared_types or [None] * len(self.header))]
+
+    # column types that fit every value seen so far, or that the file declares
+    def column_types(self):
+        inferred_types = column_types_from_summary(self.summary)
+        if self.declared_types is None:
+            return inferred_types
+        return [declared or inferred for declared, inferred in zip(self.declared_types, inferred_types)]
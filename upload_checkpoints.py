@@ -0,0 +1,112 @@
+# durable progress of uploads: every committed batch advances its file's checkpoint in the same transaction, so an
+# interrupted upload resumes after the last committed row and no row is inserted twice
+
+import os
+
+CHECKPOINT_TABLE = "chatdb__upload_checkpoints"  # hidden from the table listings like sample tables
+
+
+def is_checkpoint_table(table_name):
+    return table_name.lower() == CHECKPOINT_TABLE
+
+
+# (size, modification time) of a file, a resumed upload needs the file unchanged since its checkpoint
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# where the load of one file into a table stands: rows read past, the byte offset after them in a plain csv
+# (None in other formats), rows inserted and failed so far, and whether the whole file is loaded
+class Checkpoint:
+
+    def __init__(self, store, table_name, source, row_offset=0, byte_offset=None, inserted_rows=0, failed_rows=0,
+                 done=False):
+        self.store = store
+        self.table_name = table_name
+        self.source = source
+        self.row_offset = row_offset
+        self.byte_offset = byte_offset
+        self.inserted_rows = inserted_rows
+        self.failed_rows = failed_rows
+        self.done = done
+
+    # move past a batch inside the transaction that inserted it, the caller commits both together
+    def advance(self, cursor, row_count, byte_offset, inserted, failed, done=False):
+        self.store.update(cursor, self, self.row_offset + row_count, byte_offset, self.inserted_rows + inserted,
+                          self.failed_rows + failed, done)
+        self.row_offset += row_count
+        self.byte_offset = byte_offset
+        self.inserted_rows += inserted
+        self.failed_rows += failed
+        self.done = done
+
+    # record that the whole file is loaded, a resumed upload skips it
+    def finish(self):
+        with self.store.db_connection.cursor(commit=True) as cursor:
+            self.store.update(cursor, self, self.row_offset, self.byte_offset, self.inserted_rows, self.failed_rows,
+                              True)
+        self.done = True
+
+
+class UploadCheckpoints:
+
+    def __init__(self, db_connection):
+        self.db_connection = db_connection
+        self.table_ready = False  # created on first use
+
+    def ensure_table(self):
+        if self.table_ready:
+            return
+        with self.db_connection.cursor(commit=True) as cursor:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {self.db_connection.backend.quote(CHECKPOINT_TABLE)} ("
+                           "table_name VARCHAR(255), source VARCHAR(1024), file_size BIGINT, modified_ns BIGINT, "
+                           "row_offset BIGINT, byte_offset BIGINT, inserted_rows BIGINT, failed_rows BIGINT, "
+                           "done BOOLEAN);")
+        self.table_ready = True
+
+    # checkpoints of the files of an upload into a table: a file unchanged since an interrupted upload of it keeps
+    # its checkpoint, any other file starts from its first row
+    def begin(self, table_name, paths):
+        self.ensure_table()
+        backend = self.db_connection.backend
+        marker = backend.placeholder
+        checkpoints = []
+        with self.db_connection.cursor(commit=True, buffered=True) as cursor:
+            cursor.execute(f"SELECT source, file_size, modified_ns, row_offset, byte_offset, inserted_rows, "
+                           f"failed_rows, done FROM {backend.quote(CHECKPOINT_TABLE)} WHERE table_name = {marker};",
+                           (table_name.lower(),))
+            saved = {row[0]: row[1:] for row in cursor.fetchall()}
+            for path in paths:
+                source = os.path.abspath(path)
+                size, modified_ns, *progress = saved.get(source, (None, None))
+                if (size, modified_ns) == file_signature(path):
+                    row_offset, byte_offset, inserted_rows, failed_rows, done = progress
+                    checkpoints.append(Checkpoint(self, table_name, source, row_offset, byte_offset, inserted_rows,
+                                                  failed_rows, bool(done)))
+                    continue
+                if source in saved:  # changed since, its committed rows stay in the table
+                    print(f"'{path}' changed since its upload into '{table_name}' was interrupted, loading it from "
+                          f"the first row.")
+                cursor.execute(f"DELETE FROM {backend.quote(CHECKPOINT_TABLE)} WHERE table_name = {marker} "
+                               f"AND source = {marker};", (table_name.lower(), source))
+                cursor.execute(f"INSERT INTO {backend.quote(CHECKPOINT_TABLE)} VALUES "
+                               f"({', '.join([marker] * 9)});",
+                               (table_name.lower(), source, *file_signature(path), 0, None, 0, 0, False))
+                checkpoints.append(Checkpoint(self, table_name, source))
+        return checkpoints
+
+    def update(self, cursor, checkpoint, row_offset, byte_offset, inserted_rows, failed_rows, done):
+        marker = self.db_connection.backend.placeholder
+        cursor.execute(f"UPDATE {self.db_connection.backend.quote(CHECKPOINT_TABLE)} SET row_offset = {marker}, "
+                       f"byte_offset = {marker}, inserted_rows = {marker}, failed_rows = {marker}, done = {marker} "
+                       f"WHERE table_name = {marker} AND source = {marker};",
+                       (row_offset, byte_offset, inserted_rows, failed_rows, done, checkpoint.table_name.lower(),
+                        checkpoint.source))
+
+    # forget the checkpoints of a table once its upload completed or the table is dropped
+    def clear(self, table_name):
+        self.ensure_table()
+        with self.db_connection.cursor(commit=True) as cursor:
+            cursor.execute(f"DELETE FROM {self.db_connection.backend.quote(CHECKPOINT_TABLE)} "
+                           f"WHERE table_name = {self.db_connection.backend.placeholder};", (table_name.lower(),))
@@ -1,140 +1,375 @@
 # handles dataset uploads and exploratory data analysis
 
-import re
 import os
-import csv
-import pandas as pd
+import glob
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from db_config import upload_config, approximate_config
+from ingest_pipeline import IngestionPipeline, load_data_expression
+from type_inference import infer_column_types, SchemaProfiler
+from schema_catalog import SchemaCatalog
+from artifact_store import ArtifactStore
+from lexicon import build_lexicon
+from column_stats import build_column_stats
+from approximate import sample_table_name
+from input_formats import read_blocks, is_plain_csv, UPLOAD_SUFFIXES
+from upload_checkpoints import UploadCheckpoints, file_signature
+
+GLOB_CHARACTERS = "*?["
+
+
+# files of a partitioned upload: the csv, parquet and arrow files of a directory or the files a glob matches,
+# None for one file
+def partition_files(path):
+    if os.path.isdir(path):
+        return sorted(file_path for file_path in glob.glob(os.path.join(path, "*"))
+                      if file_path.lower().endswith(UPLOAD_SUFFIXES) and os.path.isfile(file_path))
+    if any(character in path for character in GLOB_CHARACTERS):
+        return sorted(file_path for file_path in glob.glob(path) if os.path.isfile(file_path))
+    return None
 
 
 class UploadsAnalysis:
 
-    def __init__(self, db_connection):
+    def __init__(self, db_connection, schema_catalog=None):
         self.db_connection = db_connection
+        self.schema_catalog = schema_catalog or SchemaCatalog(db_connection)  # cached column metadata
+        self.artifact_store = ArtifactStore(db_connection.database)  # per-table artifacts built at upload time
+        self.upload_checkpoints = UploadCheckpoints(db_connection)  # committed progress of interrupted uploads
+        self.analyzing = set()  # tables whose column statistics are being rebuilt in the background
 
     # method to classify uploaded datasets without predefined data types
     @staticmethod
     def infer_column_type(sample_values):
-        is_int = True  # initialize type flags
-        is_decimal = True
-        is_date = True
-        is_text = False
-
-        date_pattern = re.compile(r"^\d{4}-\d{2}-\d{2}$|^\d{2}/\d{2}/\d{4}$")  # regex pattern for date types
-
-        for value in sample_values:  # loop through values
-            value = value.strip()  # strip whitespace
-            if not value:  # skip empty values
-                continue
-            try:  # check if value can be an integer
-                int(value)
-            except ValueError:
-                is_int = False
-            try:  # check if value can be a decimal/float
-                float(value)
-            except ValueError:
-                is_decimal = False
-            if not date_pattern.match(value):  # check if value can be a date
-                is_date = False
-            else:
+        return infer_column_types(["value"], [[value] for value in sample_values])[0]
+
+    # scan the whole file once in blocks, tracking value classes, lengths and numeric ranges of every column;
+    # parquet and arrow files are profiled as text for the statistics, their embedded schema gives the types
+    @staticmethod
+    def profile_csv(csv_file_path):
+        with read_blocks(csv_file_path, upload_config["profile_block_size"], as_text=True) as (
+                header, declared_types, blocks):
+            profiler = SchemaProfiler(header, reservoir_size=upload_config["reservoir_size"],
+                                      max_distinct=upload_config["lexicon_max_distinct"])
+            profiler.declared_types = declared_types
+            for block in blocks:  # only one block is held in memory at a time
+                profiler.update(block)
+        return profiler
+
+    # profile partition files in a process pool and merge their profiles into one schema that fits every file
+    def profile_partitions(self, csv_file_paths):
+        workers = min(upload_config["parallel_workers"], os.cpu_count() or 1, len(csv_file_paths))
+        if workers > 1:
+            # spawned workers, forking a process that runs background threads is unsafe
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                profilers = list(executor.map(self.profile_csv, csv_file_paths))
+        else:  # starting a worker costs more than it saves on a single core
+            profilers = [self.profile_csv(csv_file_path) for csv_file_path in csv_file_paths]
+        merged = profilers[0]
+        for csv_file_path, profiler in zip(csv_file_paths[1:], profilers[1:]):
+            if profiler.header != merged.header:
+                raise ValueError(f"'{csv_file_path}' has the columns {', '.join(profiler.header)} but "
+                                 f"'{csv_file_paths[0]}' has {', '.join(merged.header)}")
+            merged.merge(profiler)
+        return merged
+
+    # load partition files into one table in parallel, each on its own pooled connection, with one progress line;
+    # checkpoints, one per file, resume each file after its committed rows;
+    # returns (inserted rows, failed rows, failed files as (path, error), seconds)
+    def load_partitions(self, table_name, csv_file_paths, column_types, total_rows=None, checkpoints=None):
+        start_time = time.perf_counter()
+        progress = {"inserted": 0, "files_done": 0}
+        progress_lock = threading.Lock()
+
+        # called from the writer threads of every partition
+        def report(inserted=0, files_done=0):
+            with progress_lock:
+                progress["inserted"] += inserted
+                progress["files_done"] += files_done
+                elapsed = time.perf_counter() - start_time
+                rate = progress["inserted"] / elapsed if elapsed > 0 else 0
+                done = f" of {total_rows:,}" if total_rows else ""
+                percent = f"{progress['inserted'] / total_rows:.0%}, " if total_rows else ""
+                print(f"\rInserted {progress['inserted']:,}{done} rows from {progress['files_done']} of "
+                      f"{len(csv_file_paths)} files ({percent}{rate:,.0f} rows/sec)", end="", flush=True)
+
+        inserted_count = 0
+        failed_rows = []
+        failed_files = []
+        workers = min(upload_config["parallel_workers"], self.db_connection.pool_size, len(csv_file_paths))
+        checkpoints = checkpoints or [None] * len(csv_file_paths)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.bulk_load_csv, table_name, csv_file_path, column_types, report, None,
+                                       checkpoint): csv_file_path
+                       for csv_file_path, checkpoint in zip(csv_file_paths, checkpoints)}
+            for future in as_completed(futures):
+                csv_file_path = futures[future]
                 try:
-                    pd.to_datetime(value, errors="coerce", format="%Y-%m-%d")  # strict parsing
-                except ValueError:
-                    is_date = False
-            if not is_int and not is_decimal and not is_date:  # check if the value is likely text
-                is_text = True
-            if not is_int and not is_decimal and not is_date and not is_text:  # exit early if none of the types match
-                break
-
-        if is_int:  # return the column type based on the flags
-            return "INT"
-        elif is_decimal:
-            return "DECIMAL(20, 6)"
-        elif is_date:
-            return "DATE"
-        elif is_text:
-            max_length = max(len(str(val)) for val in sample_values if val.strip() != "")
-            return f"VARCHAR({max_length if max_length > 0 else 255})"  # set varchar as the longest text in sample data
-        else:
-            return "VARCHAR(255)"  # default to varchar if no specific type is determined
-
-    # create table from csv file, dynamically detecting column types
-    def create_table_from_csv(self, table_name, csv_file_path):
-        with open(csv_file_path, 'r') as file:  # open csv file
-            csv_reader = csv.reader(file)  # read
-            header = next(csv_reader)  # read the header row
-            sample_rows = [row for _, row in zip(range(100), csv_reader)]  # read up to 100 sample rows
-
-        column_types = {}  # infer column types
-        for i, column_name in enumerate(header):  # loop through values
-            sample_values = [row[i] for row in sample_rows if len(row) > i]
-            column_types[column_name] = self.infer_column_type(sample_values)
-
-        columns = ", ".join([f"`{col}` {dtype}" for col, dtype in column_types.items()])  # join types
-        create_table_query = f"CREATE TABLE IF NOT EXISTS `{table_name}` ({columns});"  # construct create table query
+                    inserted, failed, _ = future.result()
+                except Exception as e:
+                    failed_files.append((csv_file_path, e))  # batches committed before the error are kept
+                    continue
+                inserted_count += inserted
+                failed_rows.extend((f"{idx} of {os.path.basename(csv_file_path)}", row_error)
+                                   for idx, row_error in failed)
+                report(files_done=1)
+        print()  # end the progress line
+        return inserted_count, failed_rows, failed_files, time.perf_counter() - start_time
+
+    # checkpoints of the files of an upload, saying where an interrupted upload of them resumes
+    def begin_checkpoints(self, table_name, csv_file_paths):
+        checkpoints = self.upload_checkpoints.begin(table_name, csv_file_paths)
+        resumed_rows = sum(checkpoint.row_offset for checkpoint in checkpoints)
+        if resumed_rows:
+            print(f"Resuming the upload into '{table_name}' after the {resumed_rows:,} rows it already read.")
+        return checkpoints
+
+    # create a table with the given column types, in header order
+    def create_table(self, table_name, header, column_types):
+        backend = self.db_connection.backend
+        columns = ", ".join([f"{backend.quote(col)} {backend.column_type(dtype)}"
+                             for col, dtype in zip(header, column_types)])  # join types
+        create_table_query = f"CREATE TABLE IF NOT EXISTS {backend.quote(table_name)} ({columns});"  # construct query
         cursor = self.db_connection.get_cursor()
         cursor.execute(create_table_query)
         cursor.close()
+        self.schema_catalog.table_registry.add(table_name)  # keep the cached table list current
+
+    # create table from csv file, sizing column types from statistics over the whole file, returns the profile
+    def create_table_from_csv(self, table_name, csv_file_path):
+        profiler = self.profile_csv(csv_file_path)
+        self.create_table(table_name, profiler.header, profiler.column_types())
+        return profiler
+
+    # store the lexical index NLPProcessor uses to resolve column words and values of the uploaded table
+    def save_lexicon(self, table_name, profiler):
+        columns = list(zip(profiler.header, profiler.column_types()))
+        self.artifact_store.save("lexicon", table_name, build_lexicon(columns, profiler.distinct_values))
 
-    # upload dataset from csv file to a specific tables, returns user to home page after three failed uploads
+    # store the column statistics QueryGenerator picks selective literals and grouping columns from
+    def save_column_stats(self, table_name, profiler):
+        self.artifact_store.save("stats", table_name, build_column_stats(profiler))
+
+    # store the schema pass of an upload with the artifacts built from it, returns the header, column types and row
+    # count as saved; the files' signatures tie it to the files it was taken over
+    def save_profile(self, table_name, csv_file_paths, profiler):
+        self.save_lexicon(table_name, profiler)
+        self.save_column_stats(table_name, profiler)
+        profile = {"files": {os.path.abspath(path): list(file_signature(path)) for path in csv_file_paths},
+                   "header": profiler.header, "column_types": profiler.column_types(), "row_count": profiler.row_count}
+        self.artifact_store.save("profile", table_name, profile)
+        return profile
+
+    # the profile saved by the interrupted upload this one resumes, so the files are not profiled again; None unless
+    # rows were committed and every file is unchanged since the profile was taken
+    def resumed_profile(self, table_name, csv_file_paths, checkpoints):
+        if not any(checkpoint.row_offset or checkpoint.done for checkpoint in checkpoints):
+            return None
+        profile = self.artifact_store.load("profile", table_name)
+        files = {os.path.abspath(path): list(file_signature(path)) for path in csv_file_paths}
+        return profile if profile and profile["files"] == files else None
+
+    # rebuild the column statistics of an existing table from its rows, in a background thread unless wait is set
+    def analyze_table(self, table_name, wait=False):
+        if not wait:
+            if table_name.lower() in self.analyzing:
+                return None  # already running
+            self.analyzing.add(table_name.lower())
+            thread = threading.Thread(target=self.analyze_in_background, args=(table_name,), daemon=True)
+            thread.start()
+            return thread
+        with self.db_connection.cursor(buffered=False) as cursor:  # rows stream through in profile blocks
+            cursor.execute(f"SELECT * FROM {self.db_connection.backend.quote(table_name)};")
+            header = [column[0] for column in cursor.description]
+            profiler = SchemaProfiler(header, reservoir_size=upload_config["reservoir_size"],
+                                      max_distinct=upload_config["lexicon_max_distinct"])
+            while True:
+                rows = cursor.fetchmany(upload_config["profile_block_size"])
+                if not rows:
+                    break
+                profiler.update([["" if value is None else str(value) for value in row] for row in rows])
+        self.save_column_stats(table_name, profiler)
+        return profiler
+
+    # background analyze, failures only mean the sample queries keep their default literals
+    def analyze_in_background(self, table_name):
+        try:
+            self.analyze_table(table_name, wait=True)
+        except Exception as e:
+            print(f"Column statistics for '{table_name}' could not be built: {e}")
+        finally:
+            self.analyzing.discard(table_name.lower())
+
+    # keep a bernoulli sample of a large table for approximate questions, returns the sample description; the
+    # table is counted as a whole, an upload can have appended to rows already in it
+    def build_sample_table(self, table_name):
+        sample_table = sample_table_name(table_name)
+        backend = self.db_connection.backend
+        with self.db_connection.cursor(commit=True, buffered=True) as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {backend.quote(table_name)};")
+            row_count = cursor.fetchone()[0]
+            if row_count < approximate_config["min_table_rows"]:
+                return None  # small tables are answered exactly
+            fraction = approximate_config["sample_rows"] / row_count  # inclusion probability of every row
+            cursor.execute(f"DROP TABLE IF EXISTS {backend.quote(sample_table)};")
+            cursor.execute(f"CREATE TABLE {backend.quote(sample_table)} AS SELECT * FROM {backend.quote(table_name)} "
+                           f"WHERE {backend.random_condition};", (fraction,))
+            cursor.execute(f"SELECT COUNT(*) FROM {backend.quote(sample_table)};")
+            sample_rows = cursor.fetchone()[0]
+        sample = {"table": sample_table, "fraction": fraction, "row_count": row_count, "sample_rows": sample_rows}
+        self.artifact_store.save("sample", table_name, sample)
+        return sample
+
+    # check whether the server accepts LOAD DATA LOCAL INFILE for bulk uploads
+    def local_infile_enabled(self):
+        if not upload_config["use_load_data"]:
+            return False
+        with self.db_connection.cursor() as cursor:  # pooled, partitions check from several threads
+            return self.db_connection.backend.local_infile_enabled(cursor)  # only mysql servers can
+
+    # let the server parse and load the whole file in one statement, each value transformed the way the pipeline
+    # coerces it; returns (inserted rows, failed rows, seconds), or None when the server rejected or flagged values
+    # (the statement is rolled back and the pipeline isolates the bad rows); the checkpoint is completed in the same
+    # transaction
+    def load_data_infile(self, table_name, csv_file_path, column_types, checkpoint=None):
+        start_time = time.perf_counter()
+        backend = self.db_connection.backend
+        with read_blocks(csv_file_path, 1) as (header, _, _):
+            variables = [f"@chatdb_{idx}" for idx in range(len(header))]
+        assignments = ", ".join(f"{backend.quote(column)} = {load_data_expression(column_type, variable)}"
+                                for column, column_type, variable in zip(header, column_types, variables))
+        try:
+            with self.db_connection.cursor(commit=True, buffered=True) as cursor:  # pooled, partitions load in parallel
+                cursor.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {backend.quote(table_name)} "
+                               "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' "
+                               f"IGNORE 1 LINES ({', '.join(variables)}) SET {assignments};",
+                               (os.path.abspath(csv_file_path),))
+                inserted_count = cursor.rowcount
+                cursor.execute("SELECT @@warning_count;")  # values the server truncated or replaced by zeros
+                if cursor.fetchone()[0]:
+                    raise ValueError("values loaded with warnings")  # leaves the cursor block without committing
+                if checkpoint:
+                    checkpoint.advance(cursor, inserted_count, os.path.getsize(csv_file_path), inserted_count, 0,
+                                       done=True)
+        except (ValueError, *backend.errors):  # a strict server rejects the whole statement
+            return None
+        return inserted_count, [], time.perf_counter() - start_time
+
+    # load a csv into its existing table through the streaming pipeline, returns (inserted, failed, seconds);
+    # progress, when given, is called with the rows of every inserted batch instead of printing a progress line;
+    # a checkpoint carries on after the rows an interrupted load committed
+    def bulk_load_csv(self, table_name, csv_file_path, column_types, progress=None, total_rows=None, checkpoint=None):
+        if checkpoint and checkpoint.done:
+            return 0, [], 0.0  # loaded completely before the upload was interrupted
+        resuming = checkpoint and checkpoint.row_offset
+        # the server cannot decompress or decode, nor start part way into a file
+        if is_plain_csv(csv_file_path) and not resuming and self.local_infile_enabled():
+            result = self.load_data_infile(table_name, csv_file_path, column_types, checkpoint)
+            if result is not None:
+                if progress:
+                    progress(result[0])
+                return result
+        pipeline = IngestionPipeline(self.db_connection, batch_size=upload_config["batch_size"],
+                                     queue_size=upload_config["queue_size"], progress=progress, checkpoint=checkpoint)
+        return pipeline.run(table_name, csv_file_path, column_types, total_rows)
+
+    # upload dataset from csv file to a specific tables, returns user to home page after three failed uploads;
+    # a directory or glob of partition files is loaded into one table in parallel; an interrupted upload of the same
+    # files into the same table resumes after the rows it committed, also from a later session
     def upload_dataset(self, table_name, csv_file_path):
         error_count = 0  # initialize error count
         while error_count < 3:  # allow three upload attempts
             conn = self.db_connection.connection  # get the database connection
-            cursor = conn.cursor()  # get the cursor
+            checkpoints = []
             try:
-                if not os.path.exists(csv_file_path):  # check if the file exists
-                    raise FileNotFoundError(
-                        f"No such file or directory: '{csv_file_path}'")  # raise an error if not found
-                self.create_table_from_csv(table_name, csv_file_path)  # create table dynamically
-                with open(csv_file_path, "r") as file:  # open csv file
-                    csv_reader = csv.reader(file)
-                    next(csv_reader)  # skip the header row
-                    for idx, row in enumerate(csv_reader, start=1):  # process each row
-                        placeholders = ", ".join(["%s"] * len(row))  # create placeholders for row data
-                        try:
-                            cursor.execute(f"INSERT INTO `{table_name}` VALUES ({placeholders})", row)  # insert row
-                        except Exception as row_error:  # catch row-specific errors
-                            print(f"Error inserting row {idx}: {row_error}")  # log the error
-                conn.commit()  # commit all successful inserts
+                partition_paths = partition_files(csv_file_path)
+                failed_files = []
+                if partition_paths is not None:
+                    if not partition_paths:
+                        raise FileNotFoundError(f"No CSV files found for '{csv_file_path}'")
+                    checkpoints = self.begin_checkpoints(table_name, partition_paths)
+                    profile = self.resumed_profile(table_name, partition_paths, checkpoints)
+                    if profile is None:  # schema pass, one process per file
+                        profile = self.save_profile(table_name, partition_paths,
+                                                    self.profile_partitions(partition_paths))
+                    self.create_table(table_name, profile["header"], profile["column_types"])
+                    resumed_count = sum(checkpoint.inserted_rows for checkpoint in checkpoints)
+                    inserted_count, failed_rows, failed_files, elapsed = self.load_partitions(
+                        table_name, partition_paths, profile["column_types"],
+                        profile["row_count"] - sum(checkpoint.row_offset for checkpoint in checkpoints),
+                        checkpoints)  # load pass, one connection per file
+                else:
+                    if not os.path.exists(csv_file_path):  # check if the file exists
+                        raise FileNotFoundError(
+                            f"No such file or directory: '{csv_file_path}'")  # raise an error if not found
+                    checkpoints = self.begin_checkpoints(table_name, [csv_file_path])
+                    profile = self.resumed_profile(table_name, [csv_file_path], checkpoints)
+                    if profile is None:  # schema pass over the file
+                        profile = self.save_profile(table_name, [csv_file_path], self.profile_csv(csv_file_path))
+                    self.create_table(table_name, profile["header"], profile["column_types"])
+                    resumed_count = checkpoints[0].inserted_rows  # committed by earlier attempts
+                    inserted_count, failed_rows, elapsed = self.bulk_load_csv(
+                        table_name, csv_file_path, profile["column_types"],
+                        total_rows=profile["row_count"] - checkpoints[0].row_offset,
+                        checkpoint=checkpoints[0])  # load pass, its progress in percent of the rows left
+                self.build_sample_table(table_name)
+                self.schema_catalog.invalidate(table_name)  # pick up the new table's columns on next use
+                for idx, row_error in failed_rows:  # report the rows that were isolated and skipped
+                    print(f"Error inserting row {idx}: {row_error}")
+                for failed_path, file_error in failed_files:  # partitions that stopped part way
+                    print(f"Error loading '{failed_path}': {file_error}")
+                rate = inserted_count / elapsed if elapsed > 0 else 0
+                print(f"Inserted {inserted_count:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec), "
+                      f"{len(failed_rows)} rows failed.")
+                if resumed_count:
+                    print(f"{resumed_count + inserted_count:,} rows loaded in total, {resumed_count:,} of them "
+                          f"before the upload resumed.")
+                if failed_files:
+                    print(f"{len(failed_files)} of {len(partition_paths)} files did not load completely. Rows "
+                          f"they committed are kept; upload '{csv_file_path}' into '{table_name}' again to resume "
+                          f"them.")
+                    return
+                self.upload_checkpoints.clear(table_name)  # a later upload into the table appends from row one
                 print(f"Dataset uploaded successfully into table '{table_name}'!")  # success message
                 return
 
             except Exception as e:
                 print(f"An error occurred while uploading the dataset: {e}")  # print error statement
                 error_count += 1  # increase error count
-                conn.rollback()
-                if error_count < 3:  # if less than 3 errors, allow user to try again
+                conn.rollback()  # batches committed before the error are kept
+                self.schema_catalog.invalidate(table_name)  # the table may have been created before the failure
+                if error_count < 3 and any(checkpoint.row_offset for checkpoint in checkpoints):
+                    # rows were committed, carry on from them instead of asking for the file again
+                    print(f"Retrying from the last checkpoint. You have {3 - error_count} attempts left.")
+                    print("-" * 300)
+                elif error_count < 3:  # if less than 3 errors, allow user to try again
                     print(f"Please try again! You have {3 - error_count} attempts left.")
                     print("-" * 300)
                     # ask the user to re-enter file path and table name
                     table_name = input("Enter the table name for the dataset: ").strip()
-                    csv_file_path = input("Enter the path to the CSV file: ").strip()
+                    csv_file_path = input("Enter the path to the CSV (optionally .gz/.zst), Parquet or Arrow file, "
+                                          "or a directory or glob of partitions: ").strip()
                     print("-" * 300)
                 else:  # once limit is hit, return to home page
                     print("Oops! It seems as if you've reached the maximum amount of failed attempts. I will now "
                           "return you back to the home page.")
                     return "back_to_home"
 
-            finally:
-                cursor.close()
-
         return None  # return none if the loop ends without reaching 'back_to_home'
 
     # method to remove a dataset from the database
     def remove_dataset(self):
         while True:  # keep looping until the user either removes a table or goes back
             print("Available tables in the database:")
-            cursor = self.db_connection.get_cursor()
-            cursor.execute("SHOW TABLES;")
-            tables = cursor.fetchall()
-            cursor.close()
+            table_list = self.schema_catalog.table_registry.tables()  # cached table list
 
-            if not tables:
+            if not table_list:
                 print("No tables found in the database.")
                 print("-" * 300)
                 return  # if no tables are available, exit the method
 
-            table_list = [table[0] for table in tables]
             for table_name in table_list:
                 print(f"- {table_name}")
             print("-" * 300)
@@ -146,16 +381,22 @@ class UploadsAnalysis:
             if user_input == 'back':
                 break  # exit to the home page
 
-            if user_input not in table_list:
+            if user_input not in self.schema_catalog.table_registry:
                 print(f"Table '{user_input}' not found. Try again!")
                 print("-" * 300)
                 continue  # retry the operation
 
             cursor = self.db_connection.get_cursor()  # proceed to remove the dataset
             try:
-                drop_table_query = f"DROP TABLE IF EXISTS `{user_input}`;"  # prepare query to drop table
+                quote = self.db_connection.backend.quote
+                drop_table_query = f"DROP TABLE IF EXISTS {quote(user_input)};"  # prepare query to drop table
                 cursor.execute(drop_table_query)
+                cursor.execute(f"DROP TABLE IF EXISTS {quote(sample_table_name(user_input))};")  # and its sample
                 self.db_connection.connection.commit()
+                self.schema_catalog.table_registry.remove(user_input)
+                self.artifact_store.delete_table(user_input)  # drop the table's lexicon, statistics and sample
+                self.upload_checkpoints.clear(user_input)  # and what an interrupted upload into it left
+                self.schema_catalog.invalidate(user_input)  # forget the dropped table's columns
                 print(f"Table '{user_input}' has been removed from the database.")
                 print("-" * 300)
                 break  # exit after successful deletion
@@ -169,21 +410,12 @@ class UploadsAnalysis:
 
     # fetches the column names and their data types for a given table
     def get_table_attributes(self, table_name):
-        cursor = self.db_connection.get_cursor()  # connect to database
-        query = f"""
-        SELECT COLUMN_NAME, DATA_TYPE
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_NAME = %s AND TABLE_SCHEMA = %s; 
-        """
-        cursor.execute(query, (table_name, self.db_connection.database))
-        results = cursor.fetchall()  # select attributes
-        cursor.close()
-        return results
+        return self.schema_catalog.get_columns(table_name)  # served from the shared schema catalog
 
     # fetches sample rows from a given table
     def get_sample_data(self, table_name, limit=5):
         cursor = self.db_connection.get_cursor()
-        query = f"SELECT * FROM {table_name} LIMIT %s;"  # select all data from table
+        query = f"SELECT * FROM {table_name} LIMIT {self.db_connection.backend.placeholder};"  # select all data
         cursor.execute(query, (limit,))
         results = cursor.fetchall()
         cursor.close()